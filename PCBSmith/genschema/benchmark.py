@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the s-expression hot paths, run on the bundled symbol libraries.
+
+usage: python benchmark.py [file.kicad_sym ...]
+       python benchmark.py --schematic [N ...]
+       python benchmark.py --suite [--json out.json] [--baseline base.json]
+                           [--save-baseline] [file.kicad_sym ...]
+
+The suite runs every library in a fresh process, so the reported peak RSS
+belongs to that library alone. With a baseline it exits with status 1 when a
+throughput drops by more than the tolerance.
+"""
+
+import argparse
+import contextlib
+import copy
+import glob
+import io
+import json
+import os
+import platform
+import random
+import re
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+import sexpr
+from diagram import Diagram
+from kicad_selector import KicadSelector
+from kicad_sym import KicadLibrary, KicadSymbolInstance
+from kicad_writer import KicadWriter
+
+
+def legacy_tokenize(sexp: str):
+    # the old way of finding the matched group, kept as the reference point
+    for termtypes in re.finditer(sexpr.term_regex, sexp):
+        yield [(t, v) for t, v in termtypes.groupdict().items() if v][0]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def count_tokens(tokens) -> int:
+    n = 0
+    for _ in tokens:
+        n += 1
+    return n
+
+
+def bench_tokenizer(filename: str) -> None:
+    with open(filename, "r", encoding="utf-8") as f:
+        data = f.read()
+
+    ntok, t_old = timed(count_tokens, legacy_tokenize(data))
+    _, t_new = timed(count_tokens, sexpr.tokenize(data))
+    _, t_parse = timed(sexpr.parse_sexp, data)
+    print(
+        "{:<40} {:>9} tokens  legacy {:>10.0f} tok/s  tokenize {:>10.0f} tok/s"
+        "  parse_sexp {:>10.0f} tok/s".format(
+            filename, ntok, ntok / t_old, ntok / t_new, ntok / t_parse
+        )
+    )
+
+
+def bench_memory(filename: str) -> None:
+    tracemalloc.start()
+    library = KicadLibrary.from_file(filename)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    _, t_copy = timed(copy.deepcopy, library.symbols)
+    _, t_inst = timed(
+        lambda: [KicadSymbolInstance(s, "X1", 1) for s in library.symbols]
+    )
+    print(
+        "{:<40} {:>9} symbols  {:>10} bytes loaded  {:>6.0f} bytes/symbol"
+        "  deepcopy {:>7.1f} us/symbol  instance {:>5.1f} us/symbol".format(
+            filename,
+            len(library.symbols),
+            size,
+            size / len(library.symbols),
+            t_copy * 1e6 / len(library.symbols),
+            t_inst * 1e6 / len(library.symbols),
+        )
+    )
+
+
+def make_diagram(selector: KicadSelector, name: str, count: int) -> Diagram:
+    # a chain of count copies of one symbol, wired pin 2 to pin 1
+    dia = Diagram()
+    for _ in range(count):
+        dia.add_symbol(selector.select(name))
+    for a, b in zip(dia.symbols, dia.symbols[1:]):
+        dia.add_wire(a.pins[-1], b.pins[0])
+    dia.complete_position()
+    return dia
+
+
+def bench_schematic(sizes, legacy_limit: int = 1000) -> None:
+    writer = KicadWriter("")
+    for count in sizes:
+        selector = KicadSelector()
+        selector.import_library("kicad_sym/Device.kicad_sym", lazy=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            sch = writer.gen(make_diagram(selector, "R", count))
+        new, t_new = timed(lambda: sexpr.format_tree(sch, max_nesting=4))
+        # the old formatter is quadratic, past a few thousand symbols it takes hours
+        legacy = "{:>8}".format("-")
+        if count <= legacy_limit:
+            old, t_old = timed(
+                lambda: sexpr.format_sexp(sexpr.build_sexp(sch), max_nesting=4)
+            )
+            assert old == new
+            legacy = "{:>8.3f}".format(t_old)
+        print(
+            "{:>6} symbols {:>10} bytes  build+format {} s"
+            "  format_tree {:>8.3f} s".format(count, len(new), legacy, t_new)
+        )
+
+
+def peak_memory(func, *args) -> int:
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench_stream(sizes) -> None:
+    writer = KicadWriter("")
+    for count in sizes:
+        selector = KicadSelector()
+        selector.import_library("kicad_sym/Device.kicad_sym", lazy=True)
+        dia = make_diagram(selector, "R", count)
+        with open(os.devnull, "w") as f, contextlib.redirect_stdout(io.StringIO()):
+            whole = peak_memory(
+                lambda: f.write(sexpr.format_tree(writer.gen(dia), max_nesting=4))
+            )
+            streamed = peak_memory(writer.write_stream, dia, f)
+        print(
+            "{:>6} symbols  peak memory  whole document {:>11} bytes"
+            "  streamed {:>9} bytes".format(count, whole, streamed)
+        )
+
+
+def bench_fast(sizes) -> None:
+    # uuids are random in every run, compare the output without them
+    uuids = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+    for count in sizes:
+        selector = KicadSelector()
+        selector.import_library("kicad_sym/Device.kicad_sym", lazy=True)
+        dia = make_diagram(selector, "R", count)
+        texts = []
+        times = []
+        for fast in (False, True):
+            writer = KicadWriter("", fast=fast)
+            out = io.StringIO()
+            random.seed(0)
+            with contextlib.redirect_stdout(io.StringIO()):
+                times.append(timed(writer.write_stream, dia, out)[1])
+            texts.append(uuids.sub("", out.getvalue()))
+        assert texts[0] == texts[1]
+        print(
+            "{:>6} symbols {:>6} wires  streamed {:>8.3f} s"
+            "  templates {:>8.3f} s".format(count, len(dia.wires), *times)
+        )
+
+
+DEFAULT_BASELINE = "benchmark_baseline.json"
+
+
+def peak_rss() -> int:
+    """peak resident set size of this process in bytes, 0 if unknown"""
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def best(repeat: int, func, *args):
+    # the fastest of repeat runs, the least disturbed by the rest of the machine
+    result, t = timed(func, *args)
+    for _ in range(repeat - 1):
+        t = min(t, timed(func, *args)[1])
+    return result, t
+
+
+def suite_library(filename: str, repeat: int = 3) -> dict:
+    """run the hot paths on one library, throughputs in MB/s and symbols/s"""
+    with open(filename, "r", encoding="utf-8") as f:
+        data = f.read()
+    mb = len(data.encode("utf-8")) / 1e6
+
+    _, t_parse = best(repeat, sexpr.parse_sexp, data)
+    library, t_load = best(repeat, KicadLibrary.from_file, filename)
+    nsym = len(library.symbols)
+    text, t_get = best(repeat, library.get_sexpr)
+
+    sx = [
+        "kicad_symbol_lib",
+        ["version", library.version],
+        ["generator", library.generator],
+    ]
+    for sym in library.symbols:
+        sx.append(sym.get_sexpr())
+    flat, t_build = best(repeat, sexpr.build_sexp, sx)
+    _, t_format = best(repeat, lambda: sexpr.format_sexp(flat, max_nesting=4))
+    _, t_tree = best(repeat, lambda: sexpr.format_tree(sx, max_nesting=4))
+    out_mb = len(text.encode("utf-8")) / 1e6
+
+    return {
+        "bytes": len(data),
+        "symbols": nsym,
+        "parse_sexp_mb_s": mb / t_parse,
+        "from_file_mb_s": mb / t_load,
+        "from_file_symbols_s": nsym / t_load,
+        "get_sexpr_mb_s": out_mb / t_get,
+        "get_sexpr_symbols_s": nsym / t_get,
+        "build_sexp_mb_s": out_mb / t_build,
+        "format_sexp_mb_s": out_mb / t_format,
+        "format_tree_mb_s": out_mb / t_tree,
+        "peak_rss": peak_rss(),
+    }
+
+
+def run_suite(files, repeat: int = 3) -> dict:
+    results = {}
+    for filename in files:
+        # a fresh process per library, ru_maxrss never goes down
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            results[os.path.basename(filename)] = pool.submit(
+                suite_library, filename, repeat
+            ).result()
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeat": repeat,
+        "libraries": results,
+    }
+
+
+def print_suite(report: dict) -> None:
+    columns = [
+        ("parse_sexp_mb_s", "parse MB/s"),
+        ("from_file_mb_s", "load MB/s"),
+        ("from_file_symbols_s", "load sym/s"),
+        ("get_sexpr_mb_s", "write MB/s"),
+        ("get_sexpr_symbols_s", "write sym/s"),
+        ("build_sexp_mb_s", "build MB/s"),
+        ("format_sexp_mb_s", "format MB/s"),
+        ("format_tree_mb_s", "tree MB/s"),
+    ]
+    print(
+        "{:<24}".format("library")
+        + "".join("{:>12}".format(title) for _, title in columns)
+        + "{:>12}".format("peak RSS MB")
+    )
+    for name, row in report["libraries"].items():
+        print(
+            "{:<24}".format(name)
+            + "".join("{:>12.1f}".format(row[key]) for key, _ in columns)
+            + "{:>12.1f}".format(row["peak_rss"] / 1e6)
+        )
+
+
+def compare_suite(report: dict, baseline: dict, tolerance: float) -> list:
+    """list of (library, metric, baseline, current) that got slower than allowed"""
+    regressions = []
+    for name, row in report["libraries"].items():
+        base = baseline.get("libraries", {}).get(name)
+        if base is None:
+            continue
+        for key, value in row.items():
+            if not key.endswith("_s") or key not in base:
+                continue
+            if value < base[key] * (1 - tolerance):
+                regressions.append((name, key, base[key], value))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("files", nargs="*", help="kicad_sym files")
+    parser.add_argument(
+        "--schematic", nargs="*", type=int, metavar="N",
+        help="time schematic writing for N components instead",
+    )
+    parser.add_argument("--suite", action="store_true", help="run the benchmark suite")
+    parser.add_argument("--json", help="save the suite results to this file")
+    parser.add_argument(
+        "--baseline", default=DEFAULT_BASELINE,
+        help="compare the suite against this file (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true",
+        help="store the suite results as the new baseline",
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2,
+        help="allowed slowdown against the baseline (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3,
+        help="runs per measurement, the fastest counts (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.schematic is not None:
+        sizes = args.schematic or [10, 100, 1000, 10000]
+        bench_schematic(sizes)
+        bench_stream(sizes)
+        bench_fast(sizes)
+        return 0
+
+    files = args.files or sorted(glob.glob("kicad_sym/*.kicad_sym"))
+    if not args.suite:
+        for filename in files:
+            bench_tokenizer(filename)
+        for filename in files:
+            bench_memory(filename)
+        return 0
+
+    report = run_suite(files, args.repeat)
+    print_suite(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print("baseline saved to {}".format(args.baseline))
+        return 0
+    if not os.path.exists(args.baseline):
+        print("no baseline at {}, run with --save-baseline".format(args.baseline))
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_suite(report, baseline, args.tolerance)
+    for name, key, base, value in regressions:
+        print(
+            "REGRESSION {} {}: {:.1f} -> {:.1f} ({:+.0f}%)".format(
+                name, key, base, value, (value / base - 1) * 100
+            )
+        )
+    if regressions:
+        return 1
+    print("no regressions against {}".format(args.baseline))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
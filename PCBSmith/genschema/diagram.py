@@ -4,10 +4,10 @@
 import os
 import sys
 import traceback
-import uuid
 import random
 
 from kicad_sym import KicadSymbol, Pin, KicadLibrary
+from uuid_provider import uuids
 
 # 元器件
 class DiagramSymbol(object):
@@ -18,9 +18,12 @@ class DiagramSymbol(object):
         self.pins: List[DiagramPin] = []
         # 位置 (x, y, rotation)
         self.pos = [0, 0, 0]
-        self.uuid = uuid.uuid4()
+        self.uuid = uuids.uuid4()
         self.index = symbol.index
-        self.opts = {}
+        # 选择器返回的实例自带选项，直接使用
+        self.opts = getattr(symbol, "opts", {})
+        # 仿真参数，第一次写出时生成（kicad_writer.get_spice_params）
+        self.spice = None
         self.gen_pin()
         return
 
@@ -74,7 +77,7 @@ class DiagramPin(object):
 # 边
 class DiagramWire(object):
     def __init__(self, from_: DiagramPin, to_: DiagramPin):
-        self.uuid = str(uuid.uuid4())
+        self.uuid = str(uuids.uuid4())
         self.from_: DiagramPin = from_
         self.to_: DiagramPin = to_
         self.from_.set_status()
@@ -90,6 +93,8 @@ class Diagram(object):
     def __init__(self):
         self.symbols = []
         self.wires = []
+        # 仿真命令，第一次写出时选定（kicad_writer.get_spice_command）
+        self.spice_command = None
         return
 
     def add_symbol(self, symbol: KicadSymbol):
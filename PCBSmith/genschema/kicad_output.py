@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 电路图的输出后端，KicadWriter(编号, output=后端) 通过 output.open(编号) 得到写入用的文本文件
+#   DirectoryOutput: 每张电路图一个文件，可选 gzip/xz 压缩
+#   ShardedOutput:   按编号分目录存放，每个目录最多 per_dir 个文件
+#   PackOutput:      全部追加写入一个包文件，另有偏移索引，用 PackReader 按编号读取
+#   WriterPool:      包装以上任一后端，电路图在主线程格式化到内存，由后台线程写盘
+#
+# 读取包文件：python kicad_output.py corpus.pack            列出全部编号
+#            python kicad_output.py corpus.pack 编号 [目录]  解出指定的电路图
+
+import gzip
+import io
+import lzma
+import os
+import queue
+import sys
+import threading
+
+SUFFIX = ".kicad_sch"
+# 压缩方式 -> (文件后缀, 打开压缩文件, 压缩字节, 解压字节)
+CODECS = {
+    None: ("", open, None, None),
+    "gz": (".gz", gzip.open, gzip.compress, gzip.decompress),
+    "xz": (".xz", lzma.open, lzma.compress, lzma.decompress),
+}
+
+
+class DirectoryOutput(object):
+
+    def __init__(self, root: str, compress=None):
+        # compress: None、"gz" 或 "xz"
+        if compress not in CODECS:
+            raise ValueError("unknown compression: {}".format(compress))
+        self.root = root
+        self.compress = compress
+        return
+
+    def path(self, key):
+        return os.path.join(self.root, str(key) + SUFFIX + CODECS[self.compress][0])
+
+    def open(self, key):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        opener = CODECS[self.compress][1]
+        return opener(path, "wt") if self.compress else opener(path, "w")
+
+    def fsync(self, key):
+        fd = os.open(self.path(key), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        return
+
+    def close(self):
+        return
+
+
+class ShardedOutput(DirectoryOutput):
+
+    def __init__(self, root: str, per_dir: int = 1000, compress=None):
+        # 编号为整数，编号 i 的电路图放在 root/<i // per_dir>/ 下
+        if per_dir < 1:
+            raise ValueError("per_dir must be at least 1, not {}".format(per_dir))
+        DirectoryOutput.__init__(self, root, compress)
+        self.per_dir = per_dir
+        return
+
+    def path(self, key):
+        shard = "{:05d}".format(int(key) // self.per_dir)
+        return os.path.join(self.root, shard, str(key) + SUFFIX + CODECS[self.compress][0])
+
+
+class PackOutput(object):
+
+    def __init__(self, path: str, compress=None):
+        # 包文件 path 只追加写入；索引 path + ".idx" 每行一条：编号 偏移 长度 压缩方式
+        if compress not in CODECS:
+            raise ValueError("unknown compression: {}".format(compress))
+        self.path = path
+        self.compress = compress
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.data = open(path, "ab")
+        self.index = open(path + ".idx", "a", encoding="utf-8")
+        # 多个写线程同时追加时保证记录完整
+        self.lock = threading.Lock()
+        return
+
+    def open(self, key):
+        return _Buffer(self.append, key)
+
+    def append(self, key, text: str):
+        data = text.encode("utf-8")
+        compress = CODECS[self.compress][2]
+        if compress:
+            data = compress(data)
+        with self.lock:
+            offset = self.data.seek(0, os.SEEK_END)
+            self.data.write(data)
+            # 先写数据再写索引，中断时索引中不会出现不完整的记录
+            self.data.flush()
+            self.index.write("{}\t{}\t{}\t{}\n".format(key, offset, len(data), self.compress or "-"))
+            self.index.flush()
+        return
+
+    def fsync(self, key):
+        # 包文件在 close 时统一 fsync
+        return
+
+    def sync(self):
+        with self.lock:
+            for f in (self.data, self.index):
+                f.flush()
+                os.fsync(f.fileno())
+        return
+
+    def close(self):
+        self.sync()
+        self.data.close()
+        self.index.close()
+        return
+
+
+class _Buffer(io.StringIO):
+    # 在内存中写一张电路图，关闭时把 (编号, 文本) 交给 done
+
+    def __init__(self, done, key):
+        io.StringIO.__init__(self)
+        self.done = done
+        self.key = key
+        return
+
+    def close(self):
+        if not self.closed:
+            text = self.getvalue()
+            io.StringIO.close(self)
+            self.done(self.key, text)
+        return
+
+    def __exit__(self, exc_type, exc, tb):
+        # 写入中途出错时丢弃缓冲区，不完整的电路图不交给 done
+        if exc_type is not None:
+            io.StringIO.close(self)
+            return
+        self.close()
+        return
+
+
+class WriterPool(object):
+
+    _STOP = object()
+
+    def __init__(self, output, threads: int = 4, queue_size: int = 0):
+        # output: 实际写盘的后端；queue_size: 队列中最多等待的电路图数（默认 2 * threads），
+        # 队列满时 KicadWriter.write 阻塞，内存不会因写盘跟不上而无限增长
+        self.output = output
+        self.queue = queue.Queue(queue_size or 2 * threads)
+        self.error = None
+        self.closed = False
+        self.threads = [threading.Thread(target=self.run, daemon=True) for _ in range(threads)]
+        for t in self.threads:
+            t.start()
+        return
+
+    def open(self, key):
+        return _Buffer(self.submit, key)
+
+    def submit(self, key, text: str):
+        if self.closed:
+            raise ValueError("writer pool is closed")
+        self.check()
+        self.queue.put((key, text))
+        return
+
+    def check(self):
+        # 后台线程出错时在主线程抛出
+        if self.error is not None:
+            raise self.error
+        return
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is self._STOP:
+                    return
+                key, text = item
+                if self.error is None:
+                    with self.output.open(key) as f:
+                        f.write(text)
+                    self.output.fsync(key)
+            except BaseException as e:
+                self.error = self.error or e
+            finally:
+                self.queue.task_done()
+
+    def close(self, raise_error: bool = True):
+        # 等待队列写完，之后关闭（flush + fsync）底层后端
+        # raise_error: 是否在主线程抛出后台线程的错误
+        if self.closed:
+            return
+        self.closed = True
+        for _ in self.threads:
+            self.queue.put(self._STOP)
+        for t in self.threads:
+            t.join()
+        self.output.close()
+        if raise_error:
+            self.check()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # with 中已有异常时仍然写完队列，但不用后台线程的错误替换原来的异常
+        self.close(raise_error=exc_type is None)
+        return False
+
+
+class PackReader(object):
+
+    def __init__(self, path: str):
+        self.path = path
+        # 编号 -> (偏移, 长度, 压缩方式)，同一编号写入多次时以最后一次为准
+        self.index = {}
+        with open(path + ".idx", "r", encoding="utf-8") as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) != 4:
+                    continue
+                key, offset, length, codec = fields
+                self.index[key] = (int(offset), int(length), None if codec == "-" else codec)
+        self.data = open(path, "rb")
+        return
+
+    def keys(self):
+        return list(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return str(key) in self.index
+
+    def read(self, key) -> str:
+        offset, length, codec = self.index[str(key)]
+        self.data.seek(offset)
+        data = self.data.read(length)
+        decompress = CODECS[codec][3]
+        if decompress:
+            data = decompress(data)
+        return data.decode("utf-8")
+
+    def extract(self, key, directory: str = "."):
+        # 把一条记录解成普通的电路图文件，返回文件路径
+        path = os.path.join(directory, str(key) + SUFFIX)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(self.read(key))
+        return path
+
+    def close(self):
+        self.data.close()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("usage: python kicad_output.py pack [key [directory]]")
+        sys.exit(1)
+    with PackReader(sys.argv[1]) as reader:
+        if len(sys.argv) == 2:
+            for key in reader.keys():
+                print(key)
+        else:
+            print(reader.extract(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else "."))
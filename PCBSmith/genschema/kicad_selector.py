@@ -2,79 +2,268 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import sys
 import copy
-from kicad_sym import KicadSymbol, KicadLibrary, KicadFileFormatError
+from bisect import bisect_left
+import glob
+import time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set
+from kicad_sym import KicadSymbol, KicadSymbolInstance, KicadLibrary, KicadFileFormatError, LibraryCache
+
+
+def _load_library(filepath: str, lazy: bool, cache_dir: Optional[str]):
+    # 在子进程中解析（或索引）一个符号库
+    # lazy模式下mmap不能跨进程传递，只返回符号索引
+    start = time.perf_counter()
+    cache = LibraryCache(cache_dir) if cache_dir else None
+    library = KicadLibrary.from_file(filepath, lazy=lazy, cache=cache)
+    data = library.index if lazy else library
+    hits = cache.hits if cache else 0
+    return data, time.perf_counter() - start, hits
+
+
+# 符号名 -> 编号用的前缀类别，同一类别的元器件共用一套编号
+NAME_MAPPING = {
+    "R": "R",
+    "R_Variable": "R",
+    "R_Photo": "R",
+    "R_Trim": "R",
+    "R_US": "R",
+    "CAP": "C",
+    "C_Variable": "C",
+    "C_Polarized": "C",
+    "C_Polarized_US": "C",
+    "INDUCTOR": "L",
+    "L_Ferrite": "L",
+    "L_Iron": "L",
+    "L_Iron_Small": "L",
+    "L_Small": "L",
+    "L_Trim": "L",
+    "VSOURCE": "?",
+    "ISOURCE": "?",
+    "DIODE": "D",
+    "LED": "D",
+    "D_Schottky": "D",
+    "D_Zener": "D",
+    "1N4001": "D",
+    "D": "D",
+    "D_Filled": "D",
+    "D_Small": "D",
+    "LED_Filled": "D",
+    "D_Zener_Filled": "D",
+    "D_Zener_Small": "D",
+    "Q_NPN_BCE": "Q",
+    "Q_PJFET_DGS": "Q",
+    "Q_PMOS_DGS": "Q",
+    "Q_NIGBT_CEG": "Q",
+    "PN2222A": "Q",
+    "SW_Push": "S"
+}
+
+
+# 建立关键词索引的符号属性，以及把属性值切分成词的规则
+KEYWORD_PROPERTIES = ("ki_keywords", "ki_description", "ki_fp_filters")
+KEYWORD_SPLIT = re.compile(r"[a-z0-9]+")
+
 
 # 这里全都是选择相关基础的逻辑，不涉及选择算法
 # 所有策略都在strategy相关类中
 class KicadSelector(object):
 
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[str] = None):
         self.libs = []
+        # 全局符号索引：符号名 -> 最先导入的包含该符号的库
+        self.index: Dict[str, KicadLibrary] = {}
+        # 库名 -> 库，用于 "库名:符号名" 形式的限定查找
+        self.libraries: Dict[str, KicadLibrary] = {}
         self.repeated = {}
+        # 二级索引：索引名 -> 键 -> "库名:符号名" 的集合，见 query()
+        self.query_index: Dict[str, Dict[object, Set[str]]] = {
+            "ref": {}, "pins": {}, "etypes": {}, "etype": {}, "units": {}, "power": {},
+        }
+        # 关键词倒排索引：小写词 -> "库名:符号名" 的集合，见 search()
+        self.keywords: Dict[str, Set[str]] = {}
+        # 排好序的全部关键词，用于前缀查找，新增关键词后置为None重新排序
+        self.keyword_list: Optional[List[str]] = None
+        # lazy模式导入、还没有建立二级索引的库
+        self.unindexed: List[KicadLibrary] = []
+        # 解析结果的磁盘缓存目录，None表示不使用缓存
+        self.cache = LibraryCache(cache_dir) if cache_dir else None
         return
 
 
-    def import_library(self, filepath: str):
+    def import_library(self, filepath: str, lazy: bool = False):
+        # lazy: 只建立符号索引，符号在第一次被选择时才解析
+        hits = self.cache.hits if self.cache is not None else 0
         try:
-            library = KicadLibrary.from_file(filepath)
+            library = KicadLibrary.from_file(filepath, lazy=lazy, cache=self.cache)
         except KicadFileFormatError as e:
             self.printer.red("Could not parse library: %s. (%s)" % (filepath, e))
             traceback.print_exc()
 
+        if self.cache is not None:
+            # 只报告这次导入是否命中缓存
+            print("library cache: {} ({})".format(
+                "hit" if self.cache.hits > hits else "miss", filepath
+            ))
+
+        self.add_library(library)
+        return
+
+    def add_library(self, library: KicadLibrary):
         self.libs.append(library)
+        self.libraries.setdefault(Path(library.filename).stem, library)
+        for name in library.symbol_names():
+            self.index.setdefault(name, library)
+        # lazy模式的库在第一次 query() 时才解析全部符号并建立二级索引
+        if library.index:
+            self.unindexed.append(library)
+        else:
+            self.index_symbols(library)
+        return
+
+    def index_symbols(self, library: KicadLibrary):
+        # 按位号前缀、引脚数、引脚电气类型、单元数和电源标志建立二级索引
+        libname = Path(library.filename).stem
+        for name in library.symbol_names():
+            symbol = library.get_flat_symbol(name)
+            # 同一个引脚号在不同的 De Morgan 形式中会重复出现
+            etypes = {}
+            for pin in symbol.pins:
+                etypes.setdefault(pin.number, pin.etype)
+            ref = symbol.get_property("Reference")
+            keys = {
+                "ref": ref.value if ref else "",
+                "pins": len(etypes),
+                "etypes": tuple(sorted(etypes.values())),
+                "units": symbol.unit_count,
+                "power": symbol.is_power,
+            }
+            qualified = "{}:{}".format(libname, name)
+            for index, key in keys.items():
+                self.query_index[index].setdefault(key, set()).add(qualified)
+            for etype in set(etypes.values()):
+                self.query_index["etype"].setdefault(etype, set()).add(qualified)
+            for prop in symbol.properties:
+                if prop.name in KEYWORD_PROPERTIES:
+                    for word in KEYWORD_SPLIT.findall(prop.value.lower()):
+                        self.keywords.setdefault(word, set()).add(qualified)
+        self.keyword_list = None
+        return
+
+    def search(self, *words: str, match: str = "all"):
+        # 在 ki_keywords / ki_description / ki_fp_filters 中查找关键词，
+        # 返回排好序的 "库名:符号名" 列表
+        #   以 * 结尾的词按前缀匹配，如 "schott*"
+        #   查询词与属性值按同样的规则切分，"zener diode"、"TO-92" 等于分别给出其中的每个词
+        #   match="all": 全部词都要出现（AND）；match="any": 出现任意一个（OR）
+        if match not in ("all", "any"):
+            raise ValueError("match must be 'all' or 'any', not {!r}".format(match))
+        while self.unindexed:
+            self.index_symbols(self.unindexed.pop(0))
+        if self.keyword_list is None:
+            self.keyword_list = sorted(self.keywords)
+        terms = []
+        for word in words:
+            pieces = KEYWORD_SPLIT.findall(word.lower())
+            # 只有最后一段保留前缀匹配的 *
+            if pieces and word.endswith("*"):
+                pieces[-1] += "*"
+            terms.extend(pieces)
+        found = None
+        for word in terms:
+            if word.endswith("*"):
+                prefix = word[:-1]
+                names = set()
+                i = bisect_left(self.keyword_list, prefix)
+                while i < len(self.keyword_list) and self.keyword_list[i].startswith(prefix):
+                    names |= self.keywords[self.keyword_list[i]]
+                    i += 1
+            else:
+                names = self.keywords.get(word, set())
+            if found is None:
+                found = set(names)
+            elif match == "any":
+                found |= names
+            else:
+                found &= names
+        return sorted(found or ())
+
+    def query(self, ref: Optional[str] = None, ref_prefix: Optional[str] = None,
+              pins: Optional[int] = None, etypes=None, etype: Optional[str] = None,
+              units: Optional[int] = None, power: Optional[bool] = None):
+        # 按条件查找符号，所有条件同时满足，返回排好序的 "库名:符号名" 列表，
+        # 可以直接交给 select()
+        #   ref: 位号（不含序号），如 "R"；ref_prefix: 位号前缀，如 "Q"
+        #   pins: 引脚数；etypes: 全部引脚的电气类型，如 ("passive", "passive")
+        #   etype: 至少有一个该类型的引脚，如 "output"
+        #   units: 单元数；power: 是否电源符号
+        while self.unindexed:
+            self.index_symbols(self.unindexed.pop(0))
+        found = None
+        conditions = [("ref", ref), ("pins", pins), ("etype", etype),
+                      ("units", units), ("power", power)]
+        if etypes is not None:
+            conditions.append(("etypes", tuple(sorted(etypes))))
+        for index, key in conditions:
+            if key is None:
+                continue
+            names = self.query_index[index].get(key, set())
+            found = names if found is None else found & names
+        if ref_prefix is not None:
+            names = set()
+            for key, refs in self.query_index["ref"].items():
+                if key.startswith(ref_prefix):
+                    names |= refs
+            found = names if found is None else found & names
+        if found is None:
+            found = set()
+            for refs in self.query_index["ref"].values():
+                found |= refs
+        return sorted(found)
+
+    def import_directory(self, directory: str, lazy: bool = False,
+                         processes: Optional[int] = None):
+        # 用进程池并行解析目录下的全部符号库，按文件名顺序合并到全局符号索引
+        filepaths = sorted(glob.glob(os.path.join(directory, "*.kicad_sym")))
+        cache_dir = self.cache.directory if self.cache else None
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            jobs = [pool.submit(_load_library, filepath, lazy, cache_dir)
+                    for filepath in filepaths]
+            for filepath, job in zip(filepaths, jobs):
+                try:
+                    data, seconds, hits = job.result()
+                except KicadFileFormatError as e:
+                    print("Could not parse library: %s. (%s)" % (filepath, e))
+                    continue
+                library = KicadLibrary.index_file(filepath, data) if lazy else data
+                self.add_library(library)
+                if self.cache is not None:
+                    self.cache.hits += hits
+                    self.cache.misses += 1 - hits
+                print("loaded {}: {} symbols in {:.3f}s{}".format(
+                    filepath, len(library.symbol_names()), seconds,
+                    " (cached)" if hits else ""
+                ))
+        print("imported {} libraries, {} symbols in {:.3f}s".format(
+            len(filepaths), len(self.index), time.perf_counter() - start
+        ))
         return
 
     def select_name(self, lib: KicadLibrary, name: str):
         # 在获取到的符号库中选择指定的元器件
-        for symbol in lib.symbols:
-            # 循环符号库，选择指定元器件
-            if symbol.name == name:
-                return symbol
-        return False
+        # 派生符号（extends）与父符号合并后返回，结果在库中缓存
+        symbol = lib.get_flat_symbol(name)
+        if symbol is None:
+            return False
+        return symbol
 
     def mapping_name(self, name: str):
-        mapping = {
-            "R": "R",
-            "R_Variable": "R",
-            "R_Photo": "R",
-            "R_Trim": "R",
-            "R_US": "R",
-            "CAP": "C",
-            "C_Variable": "C",
-            "C_Polarized": "C",
-            "C_Polarized_US": "C",
-            "INDUCTOR": "L",
-            "L_Ferrite": "L",
-            "L_Iron": "L",
-            "L_Iron_Small": "L",
-            "L_Small": "L",
-            "L_Trim": "L",
-            "VSOURCE": "?",
-            "ISOURCE": "?",
-            "DIODE": "D",
-            "LED": "D",
-            "D_Schottky": "D",
-            "D_Zener": "D",
-            "1N4001": "D",
-            "D": "D",
-            "D_Filled": "D",
-            "D_Small": "D",
-            "LED_Filled": "D",
-            "D_Zener_Filled": "D",
-            "D_Zener_Small": "D",
-            "Q_NPN_BCE": "Q",
-            "Q_PJFET_DGS": "Q",
-            "Q_PMOS_DGS": "Q",
-            "Q_NIGBT_CEG": "Q",
-            "PN2222A": "Q",
-            "SW_Push": "S"
-        }
-        if name in mapping:
-            return mapping[name]
-        else:
-            return name
+        return NAME_MAPPING.get(name, name)
 
     def rename_symbol(self, sym: KicadSymbol):
         index = 1
@@ -82,21 +271,74 @@ class KicadSelector(object):
         if name in self.repeated:
             index = self.repeated[name]
         self.repeated[name] = index + 1
-        newsym = copy.deepcopy(sym)
-        newsym.properties[0].value += str(index)
-        newsym.index = index
+        # 实例与库中的符号共享图形和引脚，只保存自己的位号、序号和选项
+        newsym = KicadSymbolInstance(sym, sym.properties[0].value + str(index), index)
         return newsym
 
 
+    def fork(self):
+        # 返回共享全部已导入库和索引的新选择器，只有编号状态（repeated）是独立的，
+        # 每生成一张电路图用一个
+        selector = copy.copy(self)
+        selector.repeated = {}
+        return selector
+
     # 对外部接口
     def select(self, name: str, rename: bool = True):
-        for lib in self.libs:
-            sym = self.select_name(lib, name)
-            if sym:
-                if rename:
-                    sym = self.rename_symbol(sym)
-                return sym
-        return None
+        # name 可以是符号名（按库的导入顺序优先），也可以是 "库名:符号名"
+        lib = self.index.get(name)
+        if lib is None and ":" in name:
+            libname, name = name.split(":", 1)
+            lib = self.libraries.get(libname)
+        if lib is None:
+            return None
+        sym = self.select_name(lib, name)
+        if sym and rename:
+            sym = self.rename_symbol(sym)
+        return sym or None
+
+
+# 进程内共享的符号库：每个库文件只加载一次，生成每张电路图时从这里取一个轻量的选择器
+class LibraryRegistry(object):
+
+    def __init__(self, cache_dir: Optional[str] = None):
+        self.cache_dir = cache_dir
+        self.base = KicadSelector(cache_dir=cache_dir)
+        # 已加载的库文件（绝对路径）
+        self.loaded: Set[str] = set()
+        return
+
+    def import_library(self, filepath: str, lazy: bool = False):
+        # 同一个文件重复导入时直接跳过
+        key = os.path.abspath(filepath)
+        if key in self.loaded:
+            return
+        self.base.import_library(filepath, lazy=lazy)
+        self.loaded.add(key)
+        return
+
+    def selector(self):
+        # 新选择器的库都来自注册表，编号从1开始；新的库请导入到注册表中
+        return self.base.fork()
+
+
+_registry: Optional[LibraryRegistry] = None
+
+
+def get_registry(cache_dir: Optional[str] = None) -> LibraryRegistry:
+    # 进程内唯一的注册表，第一次调用时创建；之后 cache_dir 可以省略，
+    # 但不能与创建时的不同
+    global _registry
+    if _registry is None:
+        _registry = LibraryRegistry(cache_dir=cache_dir)
+    elif cache_dir is not None and (
+        _registry.cache_dir is None
+        or os.path.abspath(cache_dir) != os.path.abspath(_registry.cache_dir)
+    ):
+        raise ValueError("library registry already uses cache_dir={!r}, not {!r}".format(
+            _registry.cache_dir, cache_dir
+        ))
+    return _registry
 
 
 if __name__ == '__main__':
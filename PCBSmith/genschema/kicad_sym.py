@@ -2,13 +2,18 @@
 Library for processing KiCad's symbol files.
 """
 
+import copy
+import hashlib
 import json
 import math
+import mmap
+import os
+import pickle
 import re
 import sys
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields, replace
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import sexpr
 
@@ -17,9 +22,17 @@ class KicadFileFormatError(ValueError):
     """any kind of problem discovered while parsing a KiCad file"""
 
 
+# bump this whenever the parsed representation changes, it invalidates the LibraryCache
+PARSER_VERSION = 3
+
 # KiCad can only handle multiples of 90 degrees
 VALID_ROTATIONS = frozenset({0, 90, 180, 270})
 
+_pin_number_int = re.compile(r"^\d+$")
+
+# values that deepcopy() can share between copies
+_ATOMIC_TYPES = (str, int, float, bool, type(None))
+
 
 def mil_to_mm(mil: float) -> float:
     return round(mil * 0.0254, 6)
@@ -30,7 +43,7 @@ def mm_to_mil(mm: float) -> float:
 
 
 def _parse_at(i):
-    sexpr_at = _get_array(i, "at")[0]
+    sexpr_at = _get_first(i, "at")
     posx = sexpr_at[1]
     posy = sexpr_at[2]
     if len(sexpr_at) == 4:
@@ -66,6 +79,9 @@ def _get_array(
 
 
 def _get_array2(data, value):
+    """return the direct children which have value as first element"""
+    if isinstance(data, sexpr.SexprNode):
+        return data.children.get(value, [])
     ret = []
     for i in data:
         if isinstance(i, list) and i[0] == value:
@@ -73,40 +89,48 @@ def _get_array2(data, value):
     return ret
 
 
+def _get_first(data, value):
+    """return the first direct child which has value as first element
+
+    falls back to a recursive search like _get_array, raises IndexError if
+    there is none at all
+    """
+    children = _get_array2(data, value)
+    if children:
+        return children[0]
+    return _get_array(data, value)[0]
+
+
 def _get_color(sexpr) -> Optional["Color"]:
     col = None
-    for i in sexpr:
-        if isinstance(i, list) and i[0] == "color":
-            col = Color(i[1], i[2], i[3], i[4])
+    for i in _get_array2(sexpr, "color"):
+        col = _flyweight(Color(i[1], i[2], i[3], i[4]))
     return col
 
 
 def _get_stroke(sexpr) -> Tuple[Optional[int], Optional["Color"]]:
     width = None
     col = None
-    for i in sexpr:
-        if isinstance(i, list) and i[0] == "stroke":
-            width = _get_value_of(i, "width")
-            col = _get_color(i)
-            break
+    for i in _get_array2(sexpr, "stroke"):
+        width = _get_value_of(i, "width")
+        col = _get_color(i)
+        break
     return (width, col)
 
 
 def _get_fill(sexpr) -> Tuple[Optional[Any], Optional["Color"]]:
     fill = None
     col = None
-    for i in sexpr:
-        if isinstance(i, list) and i[0] == "fill":
-            fill = _get_value_of(i, "type")
-            col = _get_color(i)
-            break
+    for i in _get_array2(sexpr, "fill"):
+        fill = _get_value_of(i, "type")
+        col = _get_color(i)
+        break
     return (fill, col)
 
 
 def _get_xy(sexpr, lookup) -> Tuple[float, float]:
-    for i in sexpr:
-        if isinstance(i, list) and i[0] == lookup:
-            return (i[1], i[2])
+    for i in _get_array2(sexpr, lookup):
+        return (i[1], i[2])
     return (0.0, 0.0)
 
 
@@ -132,23 +156,77 @@ def _get_value_ofRecursively(data, path, item_to_get=False):
 
 def _get_value_of(data, lookup, default=None):
     """find the array which has lookup as first element, return its 2nd element"""
-    for i in data:
-        if isinstance(i, list) and i[0] == lookup:
-            return i[1]
+    for i in _get_array2(data, lookup):
+        return i[1]
     return default
 
 
 def _has_value(data, lookup) -> bool:
     """return true if the lookup item exists"""
-    for i in data:
-        if isinstance(i, list) and i[0] == lookup:
-            return True
-    return False
+    return len(_get_array2(data, lookup)) > 0
+
+
+# Flyweights: the TextEffects and Colors created while parsing are shared by all
+# items with the same values, so they must be treated as read-only.
+_flyweights: Dict[Tuple[Any, ...], "KicadSymbolBase"] = {}
+# id of each flyweight -> its cached get_sexpr() (None until first requested)
+_flyweight_sexpr: Dict[int, Optional[List[Any]]] = {}
+
+
+def _flyweight_key(obj) -> Tuple[Any, ...]:
+    # repr() keeps 1 and 1.0 apart, they are written differently
+    return (type(obj).__name__,) + tuple(
+        _flyweight_key(v) if isinstance(v, KicadSymbolBase) else repr(v)
+        for v in (getattr(obj, f.name) for f in fields(obj))
+    )
+
+
+def _flyweight(obj):
+    """return the shared instance equal to obj, obj becomes it if there is none"""
+    key = _flyweight_key(obj)
+    shared = _flyweights.get(key)
+    if shared is None:
+        shared = _flyweights[key] = obj
+        _flyweight_sexpr[id(obj)] = None
+    return shared
+
+
+def _restore_flyweight(cls, *values):
+    return _flyweight(cls(*values))
 
 
 class KicadSymbolBase:
+    # empty, so that the slotted subclasses get no per-instance __dict__
+    __slots__ = ()
+
     def as_json(self):
-        return json.dumps(self, default=lambda x: x.__dict__, indent=2)
+        return json.dumps(
+            self,
+            default=lambda x: {f.name: getattr(x, f.name) for f in fields(x)},
+            indent=2,
+        )
+
+    def __deepcopy__(self, memo):
+        # field by field, immutable values and flyweights are shared instead of copied
+        if id(self) in _flyweight_sexpr:
+            return self
+        cls = type(self)
+        clone = cls.__new__(cls)
+        memo[id(self)] = clone
+        state = getattr(self, "__dict__", None)
+        for name in cls.__slots__ if state is None else list(state):
+            value = getattr(self, name)
+            if not isinstance(value, _ATOMIC_TYPES):
+                value = copy.deepcopy(value, memo)
+            setattr(clone, name, value)
+        return clone
+
+    def __reduce_ex__(self, protocol):
+        # unpickled flyweights are shared again
+        if id(self) in _flyweight_sexpr:
+            values = tuple(getattr(self, f.name) for f in fields(self))
+            return (_restore_flyweight, (type(self),) + values)
+        return super().__reduce_ex__(protocol)
 
     def compare_pos(self, x, y):
         if hasattr(self, "posx") and hasattr(self, "posy"):
@@ -183,7 +261,7 @@ class KicadSymbolBase:
             )
 
 
-@dataclass
+@dataclass(slots=True)
 class Color(KicadSymbolBase):
     """Encode the color of an entiry. Currently not used in the kicad_sym format"""
 
@@ -193,7 +271,7 @@ class Color(KicadSymbolBase):
     a: int
 
 
-@dataclass
+@dataclass(slots=True)
 class TextEffect(KicadSymbolBase):
     """Encode the text effect of an entiry"""
 
@@ -213,6 +291,9 @@ class TextEffect(KicadSymbolBase):
         return cls(mil_to_mm(size), mil_to_mm(size))
 
     def get_sexpr(self):
+        cached = _flyweight_sexpr.get(id(self))
+        if cached is not None:
+            return cached
         fnt = ["font", ["size", self.sizex, self.sizey]]
         if self.is_italic:
             fnt.append("italic")
@@ -234,13 +315,15 @@ class TextEffect(KicadSymbolBase):
 
         if len(justify) > 1:
             sx.append(justify)
+        if id(self) in _flyweight_sexpr:
+            _flyweight_sexpr[id(self)] = sx
         return sx
 
     @classmethod
     def from_sexpr(cls, sexpr):
-        if sexpr.pop(0) != "effects":
+        if sexpr[0] != "effects":
             return None
-        font = _get_array(sexpr, "font")[0]
+        font = _get_first(sexpr, "font")
         (sizex, sizey) = _get_xy(font, "size")
         is_italic = "italic" in font
         is_bold = "bold" in font
@@ -258,19 +341,21 @@ class TextEffect(KicadSymbolBase):
                 h_justify = "left"
             if "right" in justify[0]:
                 h_justify = "right"
-        return cls(
-            sizex,
-            sizey,
-            is_italic,
-            is_bold,
-            is_hidden,
-            is_mirrored,
-            h_justify,
-            v_justify,
+        return _flyweight(
+            cls(
+                sizex,
+                sizey,
+                is_italic,
+                is_bold,
+                is_hidden,
+                is_mirrored,
+                h_justify,
+                v_justify,
+            )
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class AltFunction(KicadSymbolBase):
     name: str
     etype: str
@@ -285,7 +370,7 @@ class AltFunction(KicadSymbolBase):
         return AltFunction(name, etype, shape)
 
 
-@dataclass
+@dataclass(slots=True)
 class Pin(KicadSymbolBase):
     name: str
     number: str
@@ -306,7 +391,7 @@ class Pin(KicadSymbolBase):
 
     def __post_init__(self):
         # try to parse the pin_number into an integer if possible
-        if self.number_int is None and re.match(r"^\d+$", self.number):
+        if self.number_int is None and _pin_number_int.match(self.number):
             self.number_int = int(self.number)
         # There is some weird thing going on with the instance creation of name_effect and
         # number_effect.
@@ -321,9 +406,9 @@ class Pin(KicadSymbolBase):
     @classmethod
     def _parse_name_or_number(cls, i, typ="name"):
         """Convert a sexpr pin-name or pin-number into a python dict"""
-        sexpr_n = _get_array(i, typ)[0]
+        sexpr_n = _get_first(i, typ)
         name = sexpr_n[1]
-        effects = TextEffect.from_sexpr(_get_array(sexpr_n, "effects")[0])
+        effects = TextEffect.from_sexpr(_get_first(sexpr_n, "effects"))
         return (name, effects)
 
     def get_sexpr(self):
@@ -372,13 +457,12 @@ class Pin(KicadSymbolBase):
     def from_sexpr(cls, sexpr, unit: int, demorgan: int) -> "Pin":
         is_global = False
         # The first 3 items are pin, type and shape
-        if sexpr.pop(0) != "pin":
+        if sexpr[0] != "pin":
             return None
-        etype = sexpr.pop(0)
-        shape = sexpr.pop(0)
+        etype = sexpr[1]
+        shape = sexpr[2]
         # the 4th item (global) is optional
-        if sexpr[0] == "global":
-            sexpr.pop(0)
+        if sexpr[3] == "global":
             is_global = True
         # fetch more properties
         is_hidden = "hide" in sexpr
@@ -393,7 +477,7 @@ class Pin(KicadSymbolBase):
                 f" (must be one of {set(VALID_ROTATIONS)})"
             )
         altfuncs = []
-        alt_n = _get_array(sexpr, "alternate")
+        alt_n = _get_array2(sexpr, "alternate")
         for alt_sexpr in alt_n:
             altfuncs.append(AltFunction.from_sexpr(alt_sexpr))
         # we also need the pin-number as integer, try to convert it.
@@ -424,7 +508,7 @@ class Pin(KicadSymbolBase):
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class Circle(KicadSymbolBase):
     centerx: float
     centery: float
@@ -449,7 +533,7 @@ class Circle(KicadSymbolBase):
     @classmethod
     def from_sexpr(cls, sexpr, unit: int, demorgan: int):
         # The first 3 items are pin, type and shape
-        if sexpr.pop(0) != "circle":
+        if sexpr[0] != "circle":
             return None
         # the 1st element
         (centerx, centery) = _get_xy(sexpr, "center")
@@ -469,7 +553,7 @@ class Circle(KicadSymbolBase):
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class Arc(KicadSymbolBase):
     # (arc (start -5.08 -1.27) (mid 0 -6.35) (end 5.08 -1.27)
     startx: float
@@ -498,7 +582,7 @@ class Arc(KicadSymbolBase):
 
     @classmethod
     def from_sexpr(cls, sexpr, unit: int, demorgan: int) -> Optional["Arc"]:
-        if sexpr.pop(0) != "arc":
+        if sexpr[0] != "arc":
             return None
         (startx, starty) = _get_xy(sexpr, "start")
         (endx, endy) = _get_xy(sexpr, "end")
@@ -521,7 +605,7 @@ class Arc(KicadSymbolBase):
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class Point(KicadSymbolBase):
     x: float
     y: float
@@ -534,7 +618,7 @@ class Point(KicadSymbolBase):
         return ["xy", self.x, self.y]
 
 
-@dataclass
+@dataclass(slots=True)
 class Polyline(KicadSymbolBase):
     points: List[Point]
     stroke_width: float = 0.254
@@ -612,9 +696,9 @@ class Polyline(KicadSymbolBase):
     @classmethod
     def from_sexpr(cls, sexpr, unit: int, demorgan: int) -> Optional["Polyline"]:
         pts = []
-        if sexpr.pop(0) != "polyline":
+        if sexpr[0] != "polyline":
             return None
-        for p in _get_array(sexpr, "pts")[0]:
+        for p in _get_first(sexpr, "pts"):
             if "xy" in p:
                 pts.append(Point(p[1], p[2]))
 
@@ -623,7 +707,7 @@ class Polyline(KicadSymbolBase):
         return Polyline(pts, stroke, scolor, fill, fcolor, unit=unit, demorgan=demorgan)
 
 
-@dataclass
+@dataclass(slots=True)
 class Text(KicadSymbolBase):
     text: str
     posx: float
@@ -644,15 +728,15 @@ class Text(KicadSymbolBase):
 
     @classmethod
     def from_sexpr(cls, sexpr, unit: int, demorgan: int) -> Optional["Text"]:
-        if sexpr.pop(0) != "text":
+        if sexpr[0] != "text":
             return None
-        text = sexpr.pop(0)
+        text = sexpr[1]
         (posx, posy, rotation) = _parse_at(sexpr)
-        effects = TextEffect.from_sexpr(_get_array(sexpr, "effects")[0])
+        effects = TextEffect.from_sexpr(_get_first(sexpr, "effects"))
         return Text(text, posx, posy, rotation, effects, unit=unit, demorgan=demorgan)
 
 
-@dataclass
+@dataclass(slots=True)
 class Rectangle(KicadSymbolBase):
     """
     Some v6 symbols use rectangles, newer ones encode them as polylines.
@@ -714,7 +798,7 @@ class Rectangle(KicadSymbolBase):
 
     @classmethod
     def from_sexpr(cls, sexpr, unit: int, demorgan: int) -> Optional["Rectangle"]:
-        if sexpr.pop(0) != "rectangle":
+        if sexpr[0] != "rectangle":
             return None
         # the 1st element
         (startx, starty) = _get_xy(sexpr, "start")
@@ -735,7 +819,7 @@ class Rectangle(KicadSymbolBase):
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class Property(KicadSymbolBase):
     name: str
     value: str
@@ -771,16 +855,27 @@ class Property(KicadSymbolBase):
 
     @classmethod
     def from_sexpr(cls, sexpr, unit: int = 0) -> Optional["Property"]:
-        if sexpr.pop(0) != "property":
+        if sexpr[0] != "property":
             return None
-        name = sexpr.pop(0)
-        value = sexpr.pop(0)
+        name = sexpr[1]
+        value = sexpr[2]
         idd = _get_value_of(sexpr, "id")
         (posx, posy, rotation) = _parse_at(sexpr)
-        effects = TextEffect.from_sexpr(_get_array(sexpr, "effects")[0])
+        effects = TextEffect.from_sexpr(_get_first(sexpr, "effects"))
         return Property(name, value, idd, posx, posy, rotation, effects)
 
 
+# the graphical items of a unit: head keyword -> (KicadSymbol attribute, class)
+_UNIT_ITEMS = {
+    "pin": ("pins", Pin),
+    "circle": ("circles", Circle),
+    "arc": ("arcs", Arc),
+    "rectangle": ("rectangles", Rectangle),
+    "polyline": ("polylines", Polyline),
+    "text": ("texts", Text),
+}
+
+
 @dataclass
 class KicadSymbol(KicadSymbolBase):
     name: str
@@ -855,6 +950,105 @@ class KicadSymbol(KicadSymbolBase):
 
         return sx
 
+    @classmethod
+    def from_sexpr(cls, sexpr, filename: str) -> "KicadSymbol":
+        """
+        Build a symbol from a top-level `(symbol ...)` s-expression.
+
+        raises KicadFileFormatError in case of problems
+        """
+        item_type = sexpr[0]
+        if item_type != "symbol":
+            raise KicadFileFormatError(f"Unexpected token found: {item_type}")
+        # retrieving the `partname`, even if formatted as `libname:partname` (legacy format)
+        partname = sexpr[1].split(":")[-1]
+
+        # we found a new part, extract the symbol name
+        symbol = cls(str(partname), libname=filename, filename=filename)
+
+        # extract extends property
+        extends = _get_array2(sexpr, "extends")
+        if extends:
+            symbol.extends = extends[0][1]
+
+        # extract properties
+        for prop in _get_array2(sexpr, "property"):
+            try:
+                # TODO: do not append the new property, if it is None
+                symbol.properties.append(Property.from_sexpr(prop))
+            except ValueError as exc:
+                raise KicadFileFormatError(
+                    f"Failed to import '{partname}': {exc}"
+                ) from exc
+
+        # get flags
+        symbol.in_bom = _get_value_of(sexpr, "in_bom", "no") == "yes"
+        symbol.on_board = _get_value_of(sexpr, "on_board", "no") == "yes"
+        if _has_value(sexpr, "power"):
+            symbol.is_power = True
+
+        # get pin-numbers properties
+        pin_numbers_info = _get_array2(sexpr, "pin_numbers")
+        if pin_numbers_info:
+            if "hide" in pin_numbers_info[0]:
+                symbol.hide_pin_numbers = True
+
+        # get pin-name properties
+        pin_names_info = _get_array2(sexpr, "pin_names")
+        if pin_names_info:
+            if "hide" in pin_names_info[0]:
+                symbol.hide_pin_names = True
+            # sometimes the pin_name_offset value does not exist, then use 20mil as default
+            symbol.pin_names_offset = _get_value_of(
+                pin_names_info[0], "offset", 0.508
+            )
+
+        # get the actual geometry information
+        # it is split over units
+        subsymbols = _get_array2(sexpr, "symbol")
+        for unit_data in subsymbols:
+            # we found a new 'subpart' (no clue how to call it properly)
+            subpart_type = unit_data[0]
+            if subpart_type != "symbol":
+                raise KicadFileFormatError(
+                    f"Unexpected token found as 'subsymbol' of {item_type}: {subpart_type}"
+                )
+            name = unit_data[1]
+
+            # split the name
+            m1 = re.match(r"^" + re.escape(partname) + r"_(\d+?)_(\d+?)$", name)
+            if not m1:
+                raise KicadFileFormatError(
+                    "Failed to parse subsymbol due to invalid name: {name}"
+                )
+
+            (unit_idx, demorgan_idx) = (m1.group(1), m1.group(2))
+            unit_idx = int(unit_idx)
+            demorgan_idx = int(demorgan_idx)
+
+            # update the amount of units, alternative-styles (demorgan)
+            symbol.unit_count = max(unit_idx, symbol.unit_count)
+            symbol.demorgan_count = max(demorgan_idx, symbol.demorgan_count)
+
+            # extract pins and graphical items, in one pass over the unit
+            for unit_item in unit_data:
+                if not isinstance(unit_item, list) or not unit_item:
+                    continue
+                kind = _UNIT_ITEMS.get(unit_item[0])
+                if kind is None:
+                    continue
+                (attr, item_cls) = kind
+                try:
+                    getattr(symbol, attr).append(
+                        item_cls.from_sexpr(unit_item, unit_idx, demorgan_idx)
+                    )
+                except ValueError as valexc:
+                    raise KicadFileFormatError(
+                        f"Failed to parse symbol {partname}: {valexc}"
+                    ) from None
+
+        return symbol
+
     def get_center_rectangle(self, units: List[int]) -> Optional[Polyline]:
         # return a polyline for the requested unit that is a rectangle
         # and is closest to the center
@@ -955,6 +1149,34 @@ class KicadSymbol(KicadSymbolBase):
         else:
             return []
 
+    def flatten(self, parent: "KicadSymbol") -> "KicadSymbol":
+        """
+        Merge a derived symbol with its (already flat) parent.
+
+        The result keeps the name and the properties of the derived symbol and
+        shares the pins, graphics and options of the parent.
+        """
+        return KicadSymbol(
+            self.name,
+            libname=self.libname,
+            filename=self.filename,
+            properties=self.properties,
+            pins=parent.pins,
+            rectangles=parent.rectangles,
+            circles=parent.circles,
+            arcs=parent.arcs,
+            polylines=parent.polylines,
+            texts=parent.texts,
+            pin_names_offset=parent.pin_names_offset,
+            hide_pin_names=parent.hide_pin_names,
+            hide_pin_numbers=parent.hide_pin_numbers,
+            is_power=parent.is_power,
+            in_bom=parent.in_bom,
+            on_board=parent.on_board,
+            unit_count=parent.unit_count,
+            demorgan_count=parent.demorgan_count,
+        )
+
     def is_graphic_symbol(self) -> bool:
         return self.extends is None and (
             not self.pins or self.get_property("Reference").value == "#SYM"
@@ -1012,6 +1234,36 @@ class KicadSymbol(KicadSymbolBase):
         return False
 
 
+class KicadSymbolInstance:
+    """
+    A placed copy of a library symbol.
+
+    Everything is read from the shared library symbol except the per-instance
+    overrides: the Reference property, the instance index and the options. The
+    library symbol must not be modified while instances refer to it.
+    """
+
+    __slots__ = ("symbol", "properties", "index", "opts")
+
+    def __init__(self, symbol: KicadSymbol, reference: str, index: int):
+        self.symbol = symbol
+        self.properties = list(symbol.properties)
+        self.properties[0] = replace(self.properties[0], value=reference)
+        self.index = index
+        self.opts: Dict[str, Any] = {}
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for attributes that are not overridden
+        if name == "symbol" or name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.symbol, name)
+
+    def __repr__(self) -> str:
+        return "KicadSymbolInstance({!r}, {!r}, {})".format(
+            self.symbol.name, self.properties[0].value, self.index
+        )
+
+
 @dataclass
 class KicadLibrary(KicadSymbolBase):
     """
@@ -1022,13 +1274,98 @@ class KicadLibrary(KicadSymbolBase):
     symbols: List[KicadSymbol] = field(default_factory=list)
     generator: str = "kicad-library-utils"
     version: str = "20211014"
+    # lazy mode: name -> (start, end) byte range of the symbol in the mapped file
+    index: Dict[str, Tuple[int, int]] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+    _data: Optional[mmap.mmap] = field(default=None, repr=False, compare=False)
+    _loaded: Dict[str, KicadSymbol] = field(
+        default_factory=dict, repr=False, compare=False
+    )
+    # how many entries of symbols are already in _loaded
+    _mapped: int = field(default=0, repr=False, compare=False)
+    # name -> symbol with its `extends` chain resolved
+    _flat: Dict[str, KicadSymbol] = field(
+        default_factory=dict, repr=False, compare=False
+    )
 
     def write(self) -> None:
         lib_file = open(self.filename, "w")
         lib_file.write(self.get_sexpr())
         lib_file.close()
 
+    def get_symbol(self, name: str) -> Optional[KicadSymbol]:
+        """
+        Return the symbol called name, or None.
+
+        In lazy mode the symbol is parsed from its byte range on first request.
+        Either way the lookup is a dict access, symbols appended to the list
+        are mapped by name on the next call (the first of a name wins).
+        """
+        if name in self._loaded:
+            return self._loaded[name]
+        if name in self.index:
+            (start, end) = self.index[name]
+            try:
+                sexpr_data = sexpr.parse_sexp(
+                    self._data[start:end].decode("utf-8"), node=True
+                )
+            except ValueError as exc:
+                raise KicadFileFormatError(
+                    f"Problem while parsing the s-expr file: {exc}"
+                ) from None
+            symbol = KicadSymbol.from_sexpr(sexpr_data, self.filename)
+            self._loaded[name] = symbol
+            self.symbols.append(symbol)
+            return symbol
+        if self._mapped != len(self.symbols):
+            for symbol in self.symbols:
+                self._loaded.setdefault(symbol.name, symbol)
+            self._mapped = len(self.symbols)
+        return self._loaded.get(name)
+
+    def get_flat_symbol(self, name: str) -> Optional[KicadSymbol]:
+        """
+        Return the symbol called name with its `extends` parents merged in.
+
+        Symbols that extend nothing are returned as they are. The result is
+        memoized, so each derived symbol is resolved once per library.
+        """
+        if name in self._flat:
+            return self._flat[name]
+        chain = []
+        symbol = self.get_symbol(name)
+        while symbol is not None and symbol.extends and symbol.name not in self._flat:
+            if any(symbol is derived for derived in chain):
+                raise KicadFileFormatError(f"Circular extends of symbol {name}")
+            chain.append(symbol)
+            parent = self.get_symbol(symbol.extends)
+            if parent is None:
+                raise KicadFileFormatError(
+                    f"Symbol {symbol.name} extends unknown symbol {symbol.extends}"
+                )
+            symbol = parent
+        if symbol is None:
+            return None
+        flat = self._flat.setdefault(symbol.name, symbol)
+        for derived in reversed(chain):
+            flat = derived.flatten(flat)
+            self._flat[derived.name] = flat
+        return flat
+
+    def symbol_names(self) -> List[str]:
+        """names of all symbols, including the ones not parsed yet (lazy mode)"""
+        names = list(self.index)
+        names.extend(s.name for s in self.symbols if s.name not in self.index)
+        return names
+
+    def load_all(self) -> None:
+        """parse every indexed symbol that was not requested yet (lazy mode)"""
+        if self.index:
+            self.symbols = [self.get_symbol(name) for name in self.index]
+
     def get_sexpr(self) -> str:
+        self.load_all()
         sx = [
             "kicad_symbol_lib",
             ["version", self.version],
@@ -1036,146 +1373,167 @@ class KicadLibrary(KicadSymbolBase):
         ]
         for sym in self.symbols:
             sx.append(sym.get_sexpr())
-        return sexpr.format_sexp(sexpr.build_sexp(sx), max_nesting=4)
+        return sexpr.format_tree(sx, max_nesting=4)
 
     @classmethod
-    def from_file(cls, filename: str) -> "KicadLibrary":
+    def iter_symbols(cls, filename: str) -> Iterator[KicadSymbol]:
+        """
+        Stream the symbols of a library file, one KicadSymbol at a time.
+
+        Only the s-expression of the symbol being built is held in memory.
+        raises KicadFileFormatError in case of problems
+        """
+        with open(filename, "r", encoding="utf-8") as f:
+            # Because of the various file format changes in the development of kicad v6 and v7,
+            # we want to ensure that this parser is only used with v6 files. Any other version
+            # will most likely not work as expected. So just don't load them at all.
+            version = None
+            try:
+                for item in sexpr.iter_subtrees(f, node=True):
+                    if item and item[0] == "version":
+                        version = item[1]
+                    if not item or item[0] != "symbol":
+                        continue
+                    if str(version) != "20211014":
+                        raise KicadFileFormatError(
+                            'Version of symbol file is not "20211014"'
+                        )
+                    yield KicadSymbol.from_sexpr(item, filename)
+            except sexpr.SexprError as exc:
+                raise KicadFileFormatError(
+                    f"Problem while parsing the s-expr file: {exc}"
+                ) from None
+            if str(version) != "20211014":
+                raise KicadFileFormatError('Version of symbol file is not "20211014"')
+
+    @classmethod
+    def from_file(
+        cls,
+        filename: str,
+        lazy: bool = False,
+        cache: Optional["LibraryCache"] = None,
+    ) -> "KicadLibrary":
         """
         Parse a symbol library from a file.
 
+        With lazy set, the file is memory-mapped and only the byte ranges of the
+        symbols are indexed, each symbol gets parsed on its first get_symbol().
+        With a cache, the parsed library (or the index in lazy mode) is loaded
+        from and stored to disk.
+
         raises KicadFileFormatError in case of problems
         """
-        library = KicadLibrary(filename)
+        if cache is not None:
+            library = cache.load(filename, lazy)
+            if library is not None:
+                return library
+        if lazy:
+            library = cls.index_file(filename)
+        else:
+            library = KicadLibrary(filename)
+            for symbol in cls.iter_symbols(filename):
+                library.symbols.append(symbol)
+        if cache is not None:
+            cache.store(filename, library, lazy)
+        return library
 
-        # read the s-expression data
-        f_name = open(filename,'r',encoding='utf-8')
-        lines = "".join(f_name.readlines())
+    @classmethod
+    def index_file(
+        cls, filename: str, index: Optional[Dict[str, Tuple[int, int]]] = None
+    ) -> "KicadLibrary":
+        """
+        Open a library in lazy mode, reusing index if it was built before.
 
-        # parse s-expr
+        raises KicadFileFormatError in case of problems
+        """
+        library = KicadLibrary(filename)
+        with open(filename, "rb") as f:
+            try:
+                library._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # an empty file can not be mapped
+                raise KicadFileFormatError(
+                    "Problem while parsing the s-expr file: file is empty"
+                ) from None
+        if index is not None:
+            library.index = index
+            return library
         try:
-            sexpr_data = sexpr.parse_sexp(lines)
+            index = sexpr.index_subtrees(library._data, "symbol")
         except ValueError as exc:
             raise KicadFileFormatError(
                 f"Problem while parsing the s-expr file: {exc}"
             ) from None
 
-        sym_list = _get_array(sexpr_data, "symbol", max_level=2)
-        f_name.close()
-
-        # Because of the various file format changes in the development of kicad v6 and v7, we want
-        # to ensure that this parser is only used with v6 files. Any other version will most likely
-        # not work as expected. So just don't load them at all.
-        version = _get_value_of(sexpr_data, "version")
-        if str(version) != "20211014":
+        # the version is stored in front of the first symbol
+        header_end = min((start for (start, _) in index.values()), default=None)
+        version = re.search(
+            rb"\(\s*version\s+([^\s()]+)\s*\)", library._data[:header_end]
+        )
+        if not version or version.group(1) != b"20211014":
             raise KicadFileFormatError('Version of symbol file is not "20211014"')
 
-        # itertate over symbol
-        for item in sym_list:
-            item_type = item.pop(0)
-            if item_type != "symbol":
-                raise KicadFileFormatError(f"Unexpected token found: {item_type}")
+        for name, span in index.items():
             # retrieving the `partname`, even if formatted as `libname:partname` (legacy format)
-            partname = item.pop(0).split(":")[-1]
-
-            # we found a new part, extract the symbol name
-            symbol = KicadSymbol(str(partname), libname=filename, filename=filename)
-
-            # extract extends property
-            extends = _get_array2(item, "extends")
-            if extends:
-                symbol.extends = extends[0][1]
-
-            # extract properties
-            for prop in _get_array(item, "property"):
-                try:
-                    # TODO: do not append the new property, if it is None
-                    symbol.properties.append(Property.from_sexpr(prop))
-                except ValueError as exc:
-                    raise KicadFileFormatError(
-                        f"Failed to import '{partname}': {exc}"
-                    ) from exc
-
-            # get flags
-            symbol.in_bom = _get_value_of(item, "in_bom", "no") == "yes"
-            symbol.on_board = _get_value_of(item, "on_board", "no") == "yes"
-            if _has_value(item, "power"):
-                symbol.is_power = True
-
-            # get pin-numbers properties
-            pin_numbers_info = _get_array2(item, "pin_numbers")
-            if pin_numbers_info:
-                if "hide" in pin_numbers_info[0]:
-                    symbol.hide_pin_numbers = True
-
-            # get pin-name properties
-            pin_names_info = _get_array2(item, "pin_names")
-            if pin_names_info:
-                if "hide" in pin_names_info[0]:
-                    symbol.hide_pin_names = True
-                # sometimes the pin_name_offset value does not exist, then use 20mil as default
-                symbol.pin_names_offset = _get_value_of(
-                    pin_names_info[0], "offset", 0.508
-                )
-
-            # get the actual geometry information
-            # it is split over units
-            subsymbols = _get_array2(item, "symbol")
-            for unit_data in subsymbols:
-                # we found a new 'subpart' (no clue how to call it properly)
-                subpart_type = unit_data.pop(0)
-                if subpart_type != "symbol":
-                    raise KicadFileFormatError(
-                        f"Unexpected token found as 'subsymbol' of {item_type}: {subpart_type}"
-                    )
-                name = unit_data.pop(0)
+            library.index.setdefault(name.split(":")[-1], span)
+        return library
 
-                # split the name
-                m1 = re.match(r"^" + re.escape(partname) + r"_(\d+?)_(\d+?)$", name)
-                if not m1:
-                    raise KicadFileFormatError(
-                        "Failed to parse subsymbol due to invalid name: {name}"
-                    )
 
-                (unit_idx, demorgan_idx) = (m1.group(1), m1.group(2))
-                unit_idx = int(unit_idx)
-                demorgan_idx = int(demorgan_idx)
+class LibraryCache:
+    """
+    On-disk cache of parsed libraries, one pickle per library file.
 
-                # update the amount of units, alternative-styles (demorgan)
-                symbol.unit_count = max(unit_idx, symbol.unit_count)
-                symbol.demorgan_count = max(demorgan_idx, symbol.demorgan_count)
+    An entry is keyed on the path, size, mtime and content hash of the library
+    and on PARSER_VERSION, a stale entry is simply parsed and written again.
+    """
 
-                # extract pins and graphical items
-                for pin in _get_array(unit_data, "pin"):
-                    try:
-                        symbol.pins.append(Pin.from_sexpr(pin, unit_idx, demorgan_idx))
-                    except ValueError as valexc:
-                        raise KicadFileFormatError(
-                            f"Failed to parse symbol {partname}: {valexc}"
-                        ) from None
-                for circle in _get_array(unit_data, "circle"):
-                    symbol.circles.append(
-                        Circle.from_sexpr(circle, unit_idx, demorgan_idx)
-                    )
-                for arc in _get_array(unit_data, "arc"):
-                    symbol.arcs.append(Arc.from_sexpr(arc, unit_idx, demorgan_idx))
-                for rect in _get_array(unit_data, "rectangle"):
-                    # symbol.polylines.append(
-                    #     Rectangle.from_sexpr(rect, unit, demorgan).as_polyline()
-                    # )
-                    symbol.rectangles.append(
-                        Rectangle.from_sexpr(rect, unit_idx, demorgan_idx)
-                    )
-                for poly in _get_array(unit_data, "polyline"):
-                    symbol.polylines.append(
-                        Polyline.from_sexpr(poly, unit_idx, demorgan_idx)
-                    )
-                for text in _get_array(unit_data, "text"):
-                    symbol.texts.append(Text.from_sexpr(text, unit_idx, demorgan_idx))
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry(self, filename: str, lazy: bool) -> str:
+        path = os.path.abspath(filename)
+        name = hashlib.sha1(path.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name + (".index" if lazy else ".lib"))
+
+    def key(self, filename: str) -> Tuple[Any, ...]:
+        st = os.stat(filename)
+        with open(filename, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        return (
+            PARSER_VERSION,
+            os.path.abspath(filename),
+            st.st_size,
+            st.st_mtime_ns,
+            digest,
+        )
 
-            # add it to the list of symbols
-            library.symbols.append(symbol)
+    def load(self, filename: str, lazy: bool = False) -> Optional[KicadLibrary]:
+        """return the cached library, or None (counted as a miss)"""
+        try:
+            with open(self._entry(filename, lazy), "rb") as f:
+                if pickle.load(f) == self.key(filename):
+                    data = pickle.load(f)
+                    self.hits += 1
+                    if lazy:
+                        return KicadLibrary.index_file(filename, data)
+                    return data
+        except (OSError, EOFError, pickle.UnpicklingError):
+            pass
+        self.misses += 1
+        return None
 
-        return library
+    def store(self, filename: str, library: KicadLibrary, lazy: bool = False) -> None:
+        entry = self._entry(filename, lazy)
+        tmp = "{}.{}.tmp".format(entry, os.getpid())
+        with open(tmp, "wb") as f:
+            pickle.dump(self.key(filename), f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(
+                library.index if lazy else library, f, pickle.HIGHEST_PROTOCOL
+            )
+        os.replace(tmp, entry)
 
 
 if __name__ == "__main__":
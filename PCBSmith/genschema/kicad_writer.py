@@ -3,61 +3,215 @@
 import os.path
 import os
 import traceback
-import uuid
 import random
 
 import sexpr
 from diagram import Diagram, DiagramSymbol, DiagramWire
+from spice_models import spice_models
+from uuid_provider import uuids
+
+# 仿真命令（每张电路图随机选一条）和 ngspice 仿真参数
+SPICE_COMMANDS = [".TRAN 0.1ns 100ns", ".DC V1 0 5 0.2"]
+SPICE_OPTIONS = ".options rshunt=1G chgtol=1e-12"
+# SPICE_OPTIONS = ".OPTIONS METHOD=TRAP RELTOL=0.01 TMAX=0.1m"
+
+# 进程内共享的库符号文本缓存
+# lib_symbols 中的文本只取决于库符号（库名:符号名），格式化一次后在所有电路图之间复用
+class LibSymbolCache(object):
+
+    def __init__(self):
+        # 库名:符号名 -> 格式化好的文本
+        self.fragments = {}
+        self.hits = 0
+        self.misses = 0
+        return
+
+    def render(self, writer, dsym: DiagramSymbol, out):
+        # 返回 dsym 的库符号在 out 当前深度下的文本
+        fragment = self.fragments.get(dsym.full_name)
+        if fragment is None:
+            self.misses += 1
+            fragment = out.render(writer.get_symbol_sexpr(dsym))
+            self.fragments[dsym.full_name] = fragment
+        else:
+            self.hits += 1
+        return fragment
+
+
+lib_symbol_cache = LibSymbolCache()
+
+
+# 电路图统一的格式化参数，模板按它预先格式化
+_formatter = sexpr.SexprFormatter(None, max_nesting=4)
+
+
+# 固定结构的记录（连线、实例头、属性、引脚）预先格式化成模板，生成时只填入数值，
+# 不再构造嵌套列表；文本与按树格式化完全一致
+class SexprTemplate(object):
+
+    # 原型中代表待填数值的占位符
+    SLOT = "\x01"
+
+    def __init__(self, proto, depth: int, open: bool = False):
+        # depth: 记录在电路图中的深度；open: 去掉最后的右括号，之后还要接子元素
+        self.proto = proto
+        self.depth = depth
+        text = _formatter.render(proto, depth)
+        if open:
+            text = text[:-1]
+        self.open = open
+        self.text = text.replace("{", "{{").replace("}", "}}").replace(self.SLOT, "{}")
+        return
+
+    def render(self, *values):
+        texts = []
+        for v in values:
+            # 数字总是单个词，不用再检查
+            if type(v) is float or type(v) is int:
+                texts.append(str(v))
+                continue
+            t = sexpr.atom_text(v)
+            if not sexpr.single_token(t):
+                # 数值中有空格、括号或引号时退回到按树格式化
+                text = _formatter.render(self.fill(self.proto, iter(values)), self.depth)
+                return text[:-1] if self.open else text
+            texts.append(t)
+        return self.text.format(*texts)
+
+    def fill(self, proto, values):
+        if isinstance(proto, list):
+            return [self.fill(x, values) for x in proto]
+        return next(values) if proto == self.SLOT else proto
+
+
+_ = SexprTemplate.SLOT
+WIRE_TEMPLATE = SexprTemplate([
+    "wire",
+    ["pts", ["xy", _, _], ["xy", _, _]],
+    ["stroke", ["width", "0"], ["type", "default"], ["color", "0 0 0 0"]],
+    ["uuid", _],
+], 1)
+INSTANCE_TEMPLATE = SexprTemplate([
+    "symbol",
+    ["lib_id", _],
+    ["at", _, _, _],
+    ["unit", 1],
+    ["in_bom", _],
+    ["on_board", _],
+    ["fields_autoplaced"],
+    ["uuid", _],
+], 1, open=True)
+PROPERTY_TEMPLATE = SexprTemplate(["property", _, _, ["id", _], ["at", _, _, _]], 2, open=True)
+PIN_TEMPLATE = SexprTemplate(["pin", _, ["uuid", _]], 2)
+SYMBOL_INSTANCE_TEMPLATE = SexprTemplate([
+    "path", _, ["reference", _], ["unit", "1"], ["value", _], ["footprint", _],
+], 2)
+del _
+
 
 class KicadWriter(object):
 
-    def __init__(self, filename: str):
+    def __init__(self, filename, stream: bool = False, fast: bool = False, output=None):
+        # output: 输出后端（见 kicad_output.py），此时 filename 是电路图在后端中的编号
         self.filename = filename
+        self.output = output
+        # 流式写入：逐段、逐个元器件/连线写入文件，不在内存中拼出整个电路图
+        # fast: 流式写入时连线和元器件实例直接用模板生成文本（隐含 stream）
+        self.stream = stream or fast
+        self.fast = fast
+        # 属性 effects 的文本缓存：repr(effects 列表) -> 文本
+        self.effects_text = {}
         return
 
+    def open(self):
+        if self.output is None:
+            return open(self.filename, "w")
+        return self.output.open(self.filename)
+
     def write(self, dia: Diagram):
-        with open(self.filename, "w") as f:
+        with self.open() as f:
+            if self.stream:
+                self.write_stream(dia, f)
+                return
             sch = self.gen(dia)
-            content = sexpr.format_sexp(
-                sexpr.build_sexp(sch),
-                max_nesting=4
-            )
+            content = sexpr.format_tree(sch, max_nesting=4)
             f.write(content)
         return
 
+    def write_stream(self, dia: Diagram, f):
+        # 每写完一段就刷到文件里，内存中只保留当前这一段
+        out = sexpr.SexprFormatter(f, max_nesting=4)
+        out.open()
+        out.atom("kicad_sch")
+        for section in self.iter_sections(dia, self.fast):
+            if isinstance(section, str):
+                # 已经按模板生成好的文本
+                out.write_text(section)
+            elif isinstance(section, tuple):
+                head, items = section
+                out.open()
+                out.atom(head)
+                if head == "lib_symbols":
+                    # 库符号使用缓存的文本，不再逐个生成和格式化
+                    for dsym in self.lib_symbols(dia):
+                        out.write_text(lib_symbol_cache.render(self, dsym, out))
+                        out.flush()
+                else:
+                    for item in items:
+                        if isinstance(item, str):
+                            out.write_text(item)
+                        else:
+                            out.write_tree(item)
+                        out.flush()
+                out.close()
+            else:
+                out.write_tree(section)
+            out.flush()
+        out.close()
+        out.finish()
+        return
+
     def gen(self, dia: Diagram):
         sch = [
             "kicad_sch",
-            ["version", "20211123"],
         ]
-        sch.append(["generator", "eeschema"])
-        uid = uuid.uuid4()
+        for section in self.iter_sections(dia):
+            if isinstance(section, tuple):
+                head, items = section
+                section = [head]
+                section.extend(items)
+            sch.append(section)
+        return sch
+
+    def iter_sections(self, dia: Diagram, fast: bool = False):
+        # 按文件中的顺序逐个生成顶层元素
+        # lib_symbols 和 symbol_instances 内容较多，以 (段名, 生成器) 的形式给出，
+        # 由调用者决定一次展开还是逐条写出
+        # fast: 连线和元器件实例直接给出格式化好的文本（字符串）
+        yield ["version", "20211123"]
+        yield ["generator", "eeschema"]
+        uid = uuids.uuid4()
         muuid = ["uuid", uid]
-        sch.append(muuid)
-        sch.append(["paper", "\"A4\""])
+        yield muuid
+        yield ["paper", "\"A4\""]
 
         # 将符号库写入电路图文件
-        sx = [
-            "lib_symbols",
-        ]
-        for dsym in dia.symbols:
-            sx.append(self.get_symbol_sexpr(dsym))
-        sch.append(sx)
+        yield ("lib_symbols", (self.get_symbol_sexpr(dsym) for dsym in self.lib_symbols(dia)))
 
         # 对元器件进行连线
         for wire in dia.wires:
-            ws = self.get_wire_sexpr(wire)
-            sch.append(ws)
+            ws = self.get_wire_text(wire) if fast else self.get_wire_sexpr(wire)
+            yield ws
 
         # 添加仿真命令，比如瞬态、AC等
-        sch.append(self.get_spice_order())
+        yield self.get_spice_order(dia)
 
         # 添加ngspice仿真参数
-        sch.append(self.get_option_order())
+        yield self.get_option_order()
 
         for dsym in dia.symbols:
             if dsym.name == "SW_Push":
-                sch.append(self.add_sw_model(dsym))
+                yield self.add_sw_model(dsym)
 
         # 添加接地引脚
 
@@ -68,48 +222,53 @@ class KicadWriter(object):
             ["page", "\"1\""]
             ],
         ]
-        sch.append(sheet)
+        yield sheet
 
         # 生成元器件实例
         for dsym in dia.symbols:
-            ds = self.get_instance_sexpr(dsym)
-            sch.append(ds)
+            ds = self.get_instance_text(dsym) if fast else self.get_instance_sexpr(dsym)
+            yield ds
 
         # 写符号实例（电路图文件结尾）
-        symbolinstance = [
-            "symbol_instances",
-        ]
+        get_symbol_instance = self.get_symbol_instance_text if fast else self.get_symbol_instance
+        yield ("symbol_instances", (get_symbol_instance(dsym) for dsym in dia.symbols))
+        return
+
+    def lib_symbols(self, dia: Diagram):
+        # 每个库符号（lib_id）只写一次，与 eeschema 一致，取第一个使用它的元器件
+        seen = set()
         for dsym in dia.symbols:
-            symbolins = []
-            symbolins.append('path "/{}"'.format(dsym.uuid))
-            symbolins.append([
-                "reference",
-                '"{}"'.format(dsym.get_prop("Reference"))
-                ])
-            symbolins.append(["unit", "1"])
-            symbolins.append([
-                "value",
-                '"{}"'.format(dsym.get_prop("Value"))
-                ])
-            symbolins.append([
-                "footprint",
-                '"{}"'.format(dsym.get_prop("Footprint"))
+            if dsym.full_name not in seen:
+                seen.add(dsym.full_name)
+                yield dsym
+        return
+
+    def get_symbol_instance(self, dsym: DiagramSymbol):
+        symbolins = []
+        symbolins.append('path "/{}"'.format(dsym.uuid))
+        symbolins.append([
+            "reference",
+            '"{}"'.format(dsym.get_prop("Reference"))
             ])
-            symbolinstance.append(symbolins)
-        sch.append(symbolinstance)
-        return sch
+        symbolins.append(["unit", "1"])
+        symbolins.append([
+            "value",
+            '"{}"'.format(dsym.get_prop("Value"))
+            ])
+        symbolins.append([
+            "footprint",
+            '"{}"'.format(dsym.get_prop("Footprint"))
+        ])
+        return symbolins
 
 
-    def get_spice_order(self):
+    def get_spice_order(self, dia: Diagram):
         ## 目前我们只设计一种仿真命令
         spiceOrder = [
             "text",
         ]
         ## 以后可以在其中进行随机选择想要仿真的形式，以及电气值
-        spiceOrderStr1 = (".TRAN 0.1ns 100ns")
-        spiceOrderStr2 = (".DC V1 0 5 0.2")
-        spice_commands = [".TRAN 0.1ns 100ns", ".DC V1 0 5 0.2"]
-        spiceOrderStr = random.choice(spice_commands)
+        spiceOrderStr = get_spice_command(dia)
         spiceOrder.append("\"" + spiceOrderStr + "\"")
         TextPosition = "170 115 0"  # 文本的位置，以后看情况在确定是否需要改动
         spiceOrder.append(["at", TextPosition])
@@ -119,7 +278,7 @@ class KicadWriter(object):
                         ["justify left bottom"],
                         ])
 
-        UUID = uuid.uuid4()
+        UUID = uuids.uuid4()
         spiceOrder.append(["uuid", UUID])
         return spiceOrder
 
@@ -129,8 +288,7 @@ class KicadWriter(object):
             "text",
         ]
         ## 以后可以在其中进行随机选择想要仿真的形式，以及电气值
-        optionOrderStr = ".options rshunt=1G chgtol=1e-12"
-        # optionOrderStr = ".OPTIONS METHOD=TRAP RELTOL=0.01 TMAX=0.1m"
+        optionOrderStr = SPICE_OPTIONS
         optionOrder.append("\"" + optionOrderStr + "\"")
         TextPosition = "150 125 0"  # 文本的位置，以后看情况在确定是否需要改动
         optionOrder.append(["at", TextPosition])
@@ -140,7 +298,7 @@ class KicadWriter(object):
                            ["justify left bottom"],
                            ])
 
-        UUID = uuid.uuid4()
+        UUID = uuids.uuid4()
         optionOrder.append(["uuid", UUID])
         return optionOrder
 
@@ -148,16 +306,7 @@ class KicadWriter(object):
         assert dsym.name == "SW_Push"
         # 临时添加开关的spice模型
         spiceOrdernew = ["text"]
-        vt = 10
-        if "vt" in dsym.opts:
-            vt = dsym.opts["vt"]
-        spiceOrderStrnew = ".model sw_push{} sw(vt={} vh=0.2 ron=1 roff=10k)".format(
-            # 开关名称
-            dsym.index,
-            # dsym.symbol.properties[0].value,
-            # vt 电压值
-            vt
-        )
+        spiceOrderStrnew = get_sw_model(dsym)
         spiceOrdernew.append("\"" + spiceOrderStrnew + "\"")
         TextPositionnew = "67.31 38.1 0"
         # 文本的位置，以后看情况在确定是否需要改动
@@ -167,13 +316,14 @@ class KicadWriter(object):
                             ["size 1.27 1.27"]],
                         ["justify left bottom"],
                         ])
-        UUIDnew = uuid.uuid4()
+        UUIDnew = uuids.uuid4()
         spiceOrdernew.append(["uuid", UUIDnew])
         return spiceOrdernew
 
 
     def get_symbol_sexpr(self, dsym: DiagramSymbol):
-        symbol = dsym.symbol
+        # 写库中的符号本身，而不是带有实例位号的副本
+        symbol = getattr(dsym.symbol, "symbol", dsym.symbol)
         # add header
         full_name = symbol.quoted_string("{}".format(
             symbol.libname + ":" + symbol.name
@@ -242,7 +392,7 @@ class KicadWriter(object):
             ["color", "0 0 0 0"],
         ]
         ssx.append(stk)
-        ssx.append(["uuid", str(uuid.uuid4())])
+        ssx.append(["uuid", wire.uuid])
         return ssx
 
     def get_property_sexpr(self, prop, sympos, effects: bool = False):
@@ -289,7 +439,7 @@ class KicadWriter(object):
 
         # add pins 并添加uuid
         for pin in symbol.pins:
-            pinuuid = uuid.uuid4()
+            pinuuid = uuids.uuid4()
             ssx = ["pin", '"{}"'.format(pin.number),
                     ["uuid", pinuuid],
                    ]
@@ -297,288 +447,147 @@ class KicadWriter(object):
 
         return sx
 
+    # 以下为 fast 模式，与对应的 get_*_sexpr 生成相同的文本（uuid、随机数的调用顺序也相同）
+    def get_wire_text(self, wire: DiagramWire):
+        return WIRE_TEMPLATE.render(
+            wire.from_.pos[0], wire.from_.pos[1],
+            wire.to_.pos[0], wire.to_.pos[1],
+            wire.uuid,
+        )
+
+    def get_effects_text(self, effects):
+        # effects 的种类很少，格式化一次后按内容复用
+        key = repr(effects)
+        text = self.effects_text.get(key)
+        if text is None:
+            text = _formatter.render(effects, 3)
+            self.effects_text[key] = text
+        return text
+
+    def get_property_text(self, prop, sympos, effects: bool = False):
+        text = PROPERTY_TEMPLATE.render(
+            prop.quoted_string(prop.name),
+            prop.quoted_string(prop.value),
+            prop.idd,
+            prop.posx + sympos[0],
+            prop.posy + sympos[1],
+            prop.rotation + sympos[2],
+        )
+        if effects:
+            text += self.get_effects_text(prop.effects.get_sexpr())
+        return text + ")"
+
+    def get_spice_property_text(self, ssx):
+        # addSpiceProperty 生成的属性：["property", 名称, 值, ["id", n], ["at", x, y, r], effects]
+        if (len(ssx) == 6 and ssx[0] == "property" and ssx[3][0] == "id"
+                and len(ssx[3]) == 2 and ssx[4][0] == "at" and len(ssx[4]) == 4):
+            return PROPERTY_TEMPLATE.render(
+                ssx[1], ssx[2], ssx[3][1], *ssx[4][1:]
+            ) + self.get_effects_text(ssx[5]) + ")"
+        return _formatter.render(ssx, 2)
+
+    def get_symbol_instance_text(self, dsym: DiagramSymbol):
+        return SYMBOL_INSTANCE_TEMPLATE.render(
+            '"/{}"'.format(dsym.uuid),
+            '"{}"'.format(dsym.get_prop("Reference")),
+            '"{}"'.format(dsym.get_prop("Value")),
+            '"{}"'.format(dsym.get_prop("Footprint")),
+        )
+
+    def get_instance_text(self, dsym: DiagramSymbol):
+        symbol = dsym.symbol
+        parts = [INSTANCE_TEMPLATE.render(
+            symbol.quoted_string("{}:{}".format(symbol.libname, symbol.name)),
+            *dsym.pos,
+            "yes" if symbol.in_bom else "no",
+            "yes" if symbol.on_board else "no",
+            dsym.uuid,
+        )]
+        for prop in symbol.properties:
+            if prop.name == "Reference" or prop.name == "Value" or prop.name == "Footprint" or prop.name == "Datasheet":
+                parts.append(self.get_property_text(prop, dsym.pos, prop.name == "Footprint"))
+
+        # 仿真属性仍由 addSpiceProperty 生成
+        if symbol.name != "0":
+            sx = []
+            addSpiceProperty(sx, dsym)
+            for ssx in sx:
+                parts.append(self.get_spice_property_text(ssx))
+
+        for pin in symbol.pins:
+            parts.append(PIN_TEMPLATE.render('"{}"'.format(pin.number), uuids.uuid4()))
+        parts.append(")")
+        return "".join(parts)
+
+def get_spice_command(dia: Diagram):
+    # 电路图的仿真命令，只选一次，电路图和 SPICE 网表使用同一条
+    if dia.spice_command is None:
+        dia.spice_command = random.choice(SPICE_COMMANDS)
+    return dia.spice_command
+
+
+def get_sw_model(dsym: DiagramSymbol):
+    vt = 10
+    if "vt" in dsym.opts:
+        vt = dsym.opts["vt"]
+    return ".model sw_push{} sw(vt={} vh=0.2 ron=1 roff=10k)".format(
+        # 开关名称
+        dsym.index,
+        # vt 电压值
+        vt
+    )
+
+
+def get_spice_params(dsym: DiagramSymbol):
+    # 元器件的仿真参数 (primitive, model, lib, node_sequence)，按符号名从 spice_models.json 中查找，
+    # 每个元器件只生成一次，电路图和 SPICE 网表（spice_writer.py）使用同一组值
+    if dsym.spice is None:
+        model = spice_models.get(dsym.symbol.name)
+        reference = dsym.symbol.properties[0].value
+        if model is None:
+            dsym.spice = (reference[0], None, None, None)
+        else:
+            dsym.spice = (
+                model.get_primitive(reference),
+                model.gen_model(dsym.index),
+                model.lib,
+                model.node_sequence,
+            )
+    return dsym.spice
+
+
 def addSpiceProperty(sx, dsym: DiagramSymbol):
     symbol = dsym.symbol
     SymbolPosition = dsym.pos
+    at = ["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]]
+    # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
+    effects = symbol.properties[3].effects.get_sexpr()
+    primitive, value, lib, node_sequence = get_spice_params(dsym)
+
+    def add(idd, name, value=None):
+        prop = ["property", "\"" + name + "\""]
+        if value is not None:
+            prop.append("\"" + value + "\"")
+        prop.append(["id", idd])
+        prop.append(at)
+        prop.append(effects)
+        sx.append(prop)
+        return
+
     # 给元器件添加仿真用的参数“Spice_primitive”\"Spice_Model"\"Spice_Netlist_Enabled"
-    ## 添加“Spice_primitive”
-    print("spice_primitive=", symbol.properties[0].value[0])
-    if symbol.name == "Q_PMOS_DGS" or symbol.name == "Q_PJFET_DGS" or symbol.name == "Q_NIGBT_CEG":
     ## 目前除了GND的reference的值是“#GND‘,其它元器件的Reference的值与spice_Pcirmitive的值是一样的，都用单个字符表示
-        spiceSex1 = [
-            "property",
-            "\"" + "Spice_Primitive" + "\"",
-            "\"" + "X" + "\"",  ## 获取Reference的值，不要后面的顺序号,这就可以做为Spice_Primitive的值
-        ]
-    else:
-        spiceSex1 = [
-            "property",
-            "\"" + "Spice_Primitive" + "\"",
-            "\"" + symbol.properties[0].value[0] + "\"",  ## 获取Reference的值，不要后面的顺序号,这就可以做为Spice_Primitive的值
-        ]
-
-    spiceSex1.append(["id", "4"], )
-    spiceSex1.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-    spiceSex1.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-
-    sx.append(spiceSex1)
-
-    ## 添加"Spice_Model"
-    spiceSex2 = [
-        "property",
-        "\"" + "Spice_Model" + "\"",
-    ]
-
+    print("spice_primitive=", symbol.properties[0].value[0])
+    add("4", "Spice_Primitive", primitive)
     ## 根据不同元器件进行仿真电器值设定
-    if (symbol.name == "R" or symbol.name == "R_Variable" or symbol.name == "R_Photo" or symbol.name == "R_Trim" or
-            symbol.name == "R_US"):
-        parameterValues = random.randint(1, 1000)  # 设置电阻值，之后可以随机生成
-        spiceSex2.append("\"" + str(parameterValues) + "\"")
-    elif symbol.name == "CAP" or symbol.name == "C_Variable" or symbol.name == "C_Polarized" or symbol.name == "C_Polarized_US":
-        parameterValues = random.randint(1, 1000)  # 设置电容值，之后可以随机生成
-        spiceSex2.append("\"" + str(parameterValues) + "nF" + "\"")
-    elif (symbol.name == "INDUCTOR" or symbol.name == "L_Ferrite" or symbol.name == "L_Iron" or symbol.name == "L_Iron_Small"
-          or symbol.name == "L_Small" or symbol.name == "L_Trim"):
-        parameterValue1 = random.randint(1, 1000)  # 设置电感值，之后可以随机生成
-        sexprText1 = "\"" + str(parameterValue1) + "uH" + "\""
-        parameterValue2 = random.randint(10,100)
-        sexprText2 = "\"" + str(parameterValue2) + "mH" + "\""
-        selected_string = random.choice([sexprText1, sexprText2])
-        spiceSex2.append(selected_string)
-    elif symbol.name == "VSOURCE" or symbol.name == "ISOURCE":
-        parameterValues = random.randint(3, 100)
-        # assert "dc" in dsym.opts
-        # parameterValues = dsym.opts["dc"]
-        spiceSex2.append("\"" + "dc" + " " + str(parameterValues) + "\"")
-    elif symbol.name == "SW_Push":
-        parameterValues = "1 0 sw_push{}".format(
-            dsym.index
-            # symbol.properties[0].value
-        )
-        spiceSex2.append("\"" + str(parameterValues) + "\"")
-    elif symbol.name == "DIODE":
-        modelName = "1N3491"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "D_Schottky":
-        modelName = "1N5711"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "D_Zener":
-        # modelName = "BZT52C2V7LP"
-        modelName = "10A01"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "LED":
-        modelName = "A1SS-O612_VFBIN_D"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "1N4001":
-        modelName = "1N4001"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "D":
-        modelName = "1N4002"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "D_Filled":
-        modelName = "1N4003"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "D_Small":
-        modelName = "1N4004"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "LED_Filled":
-        modelName = "LED_GENERAL"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "D_Zener_Filled":
-        modelName = "DI_1N4728A"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "D_Zener_Small":
-        modelName = "DI_AZ23C10W"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "Q_NPN_BCE" or symbol.name == "PN2222A":
-        modelName = "PN2222"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "Q_PJFET_DGS":
-        # modelName = "2N7002A"
-        modelName = "DMG4435SSS"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "Q_PMOS_DGS":
-        # modelName = "DI_DMG6968U"
-        modelName = "DI_DMG6968UDM"
-        spiceSex2.append("\"" + modelName + "\"")
-    elif symbol.name == "Q_NIGBT_CEG":
-        modelName = "APT100G2"
-        spiceSex2.append("\"" + modelName + "\"")
-
-
-    spiceSex2.append(["id", "5"], )
-    spiceSex2.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-    spiceSex2.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-
-    sx.append(spiceSex2)
-
-    ## 添加"Spice_Netlist_Enabled"
-    spiceSex3 = [
-        "property",
-        "\"" + "Spice_Netlist_Enabled" + "\"",
-        "\"" + "Y" + "\"",
-    ]
-    spiceSex3.append(["id", "6"], )
-    spiceSex3.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-    spiceSex3.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-
-    sx.append(spiceSex3)
-
-    ## 有源器件需要给模型添加spice模型
-    if symbol.name == "DIODE":
-        ## 添加"Spice_Lib_File"属性
-        spiceSex4 = [
-            "property",
-            "\"" + "Spice_Lib_File" + "\"",
-        ]
-        ## 这个是给元器件选择实际模型的时候所在库的位置，目前先根据元器件都写死，之后再看如何动态选择等
-        spiceLib = "D:\spice_lib\MicroCap-LIBRARY-for-ngspice\diode.lib"
-        spiceSex4.append("\"" + spiceLib + "\"")
-        spiceSex4.append(["id", "7"], )
-        spiceSex4.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-        spiceSex4.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-        sx.append(spiceSex4)
-    if symbol.name == "D_Schottky":
-        ## 添加"Spice_Lib_File"属性
-        spiceSex4 = [
-            "property",
-            "\"" + "Spice_Lib_File" + "\"",
-        ]
-        ## 这个是给元器件选择实际模型的时候所在库的位置，目前先根据元器件都写死，之后再看如何动态选择等
-        spiceLib = "D:\spice_lib\MicroCap-LIBRARY-for-ngspice\diode.lib"
-        spiceSex4.append("\"" + spiceLib + "\"")
-        spiceSex4.append(["id", "7"], )
-        spiceSex4.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-        spiceSex4.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-        sx.append(spiceSex4)
-    if symbol.name == "D_Zener":
-        ## 添加"Spice_Lib_File"属性
-        spiceSex4 = [
-            "property",
-            "\"" + "Spice_Lib_File" + "\"",
-        ]
-        ## 这个是给元器件选择实际模型的时候所在库的位置，目前先根据元器件都写死，之后再看如何动态选择等
-        spiceLib = "D:\spice_lib\MicroCap-LIBRARY-for-ngspice\DiodesInc.lib"
-        spiceSex4.append("\"" + spiceLib + "\"")
-        spiceSex4.append(["id", "7"], )
-        spiceSex4.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-        spiceSex4.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-        sx.append(spiceSex4)
-    if symbol.name == "LED":
-        ## 添加"Spice_Lib_File"属性
-        spiceSex4 = [
-            "property",
-            "\"" + "Spice_Lib_File" + "\"",
-        ]
-        spiceLib = "D:\spice_lib\\\\basic_models\LED\SnapLED150.mod"
-        # spiceLib = os.path.join('D:','spice_lib','basic_models','LED','SnapLED150.mod')
-        spiceSex4.append("\"" + spiceLib + "\"")
-        spiceSex4.append(["id", "7"], )
-        spiceSex4.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-        spiceSex4.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-        sx.append(spiceSex4)
-    if symbol.name == "1N4001" or symbol.name == "D" or symbol.name == "D_Filled" or symbol.name == "D_Small":
-        ## 添加"Spice_Lib_File"属性
-        spiceSex4 = [
-            "property",
-            "\"" + "Spice_Lib_File" + "\"",
-        ]
-        spiceLib = "D:\spice_lib\\\\basic_models\diodes\diode.lib"
-        # spiceLib = os.path.join('D:','spice_lib','basic_models','LED','SnapLED150.mod')
-        spiceSex4.append("\"" + spiceLib + "\"")
-        spiceSex4.append(["id", "7"], )
-        spiceSex4.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-        spiceSex4.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-        sx.append(spiceSex4)
-    if symbol.name == "LED_Filled":
-        ## 添加"Spice_Lib_File"属性
-        spiceSex4 = [
-            "property",
-            "\"" + "Spice_Lib_File" + "\"",
-        ]
-        spiceLib = ("D:\spice_lib\KiCad-Spice-Library-master\Models\Diode\led.lib")
-        # spiceLib = os.path.join('D:','spice_lib','basic_models','LED','SnapLED150.mod')
-        spiceSex4.append("\"" + spiceLib + "\"")
-        spiceSex4.append(["id", "7"], )
-        spiceSex4.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-        spiceSex4.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-        sx.append(spiceSex4)
-    if symbol.name == "D_Zener_Filled" or symbol.name == "D_Zener_Small":
-        ## 添加"Spice_Lib_File"属性
-        spiceSex4 = [
-            "property",
-            "\"" + "Spice_Lib_File" + "\"",
-        ]
-        spiceLib = ("D:\spice_lib\KiCad-Spice-Library-master\Models\Diode\zener.lib")
-        # spiceLib = os.path.join('D:','spice_lib','basic_models','LED','SnapLED150.mod')
-        spiceSex4.append("\"" + spiceLib + "\"")
-        spiceSex4.append(["id", "7"], )
-        spiceSex4.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-        spiceSex4.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-        sx.append(spiceSex4)
-    if symbol.name == "Q_NPN_BCE" or symbol.name == "PN2222A":
-        ## 添加"Spice_Lib_File"属性
-        spiceSex5 = [
-            "property",
-            "\"" + "Spice_Lib_File" + "\"",
-        ]
-        spiceLib = "D:\spice_lib\modelos_subckt\PN2222.mod"
-        spiceSex5.append("\"" + spiceLib + "\"")
-        spiceSex5.append(["id", "7"], )
-        spiceSex5.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-        spiceSex5.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-        sx.append(spiceSex5)
-        ## 添加"Spice_Node_Sequence"属性,因为三极管引脚是有顺序的集电极，基极，发射极，基板（可选）
-        ## 需要将符号的引脚与模型的引脚的顺序相对应，因此需要添加该属性
-        spiceSex6 = [
-            "property",
-            "\"" + "Spice_Node_Sequence" + "\"",
-        ]
-        NodeSequence = "2,1,3"  # 目前固定的这个模型引脚顺序为2，1,3
-        spiceSex6.append("\"" + NodeSequence + "\"")
-        spiceSex6.append(["id", "8"], )
-        spiceSex6.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-        spiceSex6.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-        sx.append(spiceSex6)
-    if symbol.name == "Q_PJFET_DGS":
-        ## 添加"Spice_Lib_File"属性
-        spiceSex5 = [
-            "property",
-            "\"" + "Spice_Lib_File" + "\"",
-        ]
-        ## 这个是给元器件选择实际模型的时候所在库的位置，目前先根据元器件都写死，之后再看如何动态选择等
-        spiceLib = "D:\spice_lib\MicroCap-LIBRARY-for-ngspice\DiodesInc_FET.lib"
-        spiceSex5.append("\"" + spiceLib + "\"")
-        spiceSex5.append(["id", "7"], )
-        spiceSex5.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-        spiceSex5.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-        sx.append(spiceSex5)
-    if symbol.name == "Q_PMOS_DGS":
-        ## 添加"Spice_Lib_File"属性
-        spiceSex5 = [
-            "property",
-            "\"" + "Spice_Lib_File" + "\"",
-        ]
-        ## 这个是给元器件选择实际模型的时候所在库的位置，目前先根据元器件都写死，之后再看如何动态选择等
-        spiceLib = "D:\spice_lib\MicroCap-LIBRARY-for-ngspice\DiodesInc_MOSFET.LIB"
-        spiceSex5.append("\"" + spiceLib + "\"")
-        spiceSex5.append(["id", "7"], )
-        spiceSex5.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-        spiceSex5.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-        sx.append(spiceSex5)
-    if symbol.name == "Q_NIGBT_CEG":
-        ## 添加"Spice_Lib_File"属性
-        spiceSex5 = [
-            "property",
-            "\"" + "Spice_Lib_File" + "\"",
-        ]
-        ## 这个是给元器件选择实际模型的时候所在库的位置，目前先根据元器件都写死，之后再看如何动态选择等
-        spiceLib = r"D:\spice_lib\KiCad-Spice-Library-master\Models\uncategorized\spice_complete\IGBT.LIB"
-        spiceSex5.append("\"" + spiceLib + "\"")
-        spiceSex5.append(["id", "7"], )
-        spiceSex5.append(["at", SymbolPosition[0], SymbolPosition[1], SymbolPosition[2]], )
-        spiceSex5.append(symbol.properties[3].effects.get_sexpr())  # 与Datasheet属性的effects值一样，我们就直接用，就不进行拼接了
-        sx.append(spiceSex5)
+    add("5", "Spice_Model", value)
+    add("6", "Spice_Netlist_Enabled", "Y")
+    ## 有源器件需要给模型添加spice模型，这个是给元器件选择实际模型的时候所在库的位置
+    if lib is not None:
+        add("7", "Spice_Lib_File", lib)
+    ## 三极管引脚是有顺序的，需要将符号的引脚与模型的引脚的顺序相对应
+    if node_sequence is not None:
+        add("8", "Spice_Node_Sequence", node_sequence)
+    return
 
 
 if __name__ == '__main__':
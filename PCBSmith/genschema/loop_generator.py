@@ -3,14 +3,26 @@
 
 import os
 import sys
+import argparse
+import contextlib
 import random
 import re
 import numpy as np
 import time
 
 from diagram import *
-from kicad_selector import KicadSelector
-from kicad_writer import KicadWriter
+from kicad_selector import KicadSelector, get_registry
+from kicad_writer import KicadWriter, lib_symbol_cache
+from kicad_output import DirectoryOutput, ShardedOutput, PackOutput, WriterPool
+from spice_writer import SpiceWriter
+from uuid_provider import uuids
+
+def positive_int(text):
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be a positive integer: {}".format(text))
+    return value
+
 
 class LoopGenerator(object):
 
@@ -195,17 +207,55 @@ if __name__ == '__main__':
     folder_path = "./gendir/"
     generator_num = 100
 
-    for i in range(generator_num):
-        selector = KicadSelector()
-        selector.import_library("kicad_sym/pspice.kicad_sym")
-        selector.import_library("kicad_sym/Switch.kicad_sym")
-        selector.import_library("kicad_sym/Device.kicad_sym")
-        selector.import_library("kicad_sym/Diode.kicad_sym")
-        selector.import_library("kicad_sym/Transistor_BJT.kicad_sym")
-        print(f"Start generating {i}.kicad_sch!")
-        ComponentNumber = random.randint(10,100)
-        dia = LoopGenerator(selector).gen(ComponentNumber)
-        KicadWriter(folder_path+str(i)+".kicad_sch").write(dia)
-        print(f"{i}.kicad_sch generated sucessfully!")
+    # python loop_generator.py [种子] [--output dir|sharded|pack] [--compress gz|xz] [--spice-deck 网表]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("seed", nargs="?", type=int,
+                        help="给定种子时随机数和 uuid 都是确定的，相同的种子生成完全相同的文件")
+    # 大量生成时用 sharded 分目录存放（每个目录最多 --per-dir 个文件），
+    # 或用 pack 写入单个包文件 corpus.pack（用 kicad_output.py 读取）
+    parser.add_argument("--output", choices=["dir", "sharded", "pack"], default="dir")
+    parser.add_argument("--per-dir", type=positive_int, default=1000)
+    parser.add_argument("--compress", choices=["gz", "xz"], default=None)
+    # 只测试仿真器时，同时把全部电路写成一个 ngspice 网表
+    parser.add_argument("--spice-deck", metavar="FILE", default=None)
+    args = parser.parse_args()
+
+    # 先打开网表，路径有误时不会留下写了一半的输出
+    spice_deck = SpiceWriter(args.spice_deck) if args.spice_deck else None
+    if args.output == "sharded":
+        backend = ShardedOutput(folder_path, args.per_dir, compress=args.compress)
+    elif args.output == "pack":
+        backend = PackOutput(folder_path + "corpus.pack", compress=args.compress)
+    else:
+        backend = DirectoryOutput(folder_path, compress=args.compress)
+
+    if args.seed is not None:
+        seed = args.seed
+        random.seed(seed)
+        np.random.seed(seed)
+        uuids.seed(seed)
+
+    # 符号库在整个进程中只加载一次，每张电路图使用独立编号的选择器
+    registry = get_registry(cache_dir="./.libcache/")
+    registry.import_library("kicad_sym/pspice.kicad_sym", lazy=True)
+    registry.import_library("kicad_sym/Switch.kicad_sym", lazy=True)
+    registry.import_library("kicad_sym/Device.kicad_sym", lazy=True)
+    registry.import_library("kicad_sym/Diode.kicad_sym", lazy=True)
+    registry.import_library("kicad_sym/Transistor_BJT.kicad_sym", lazy=True)
 
+    # WriterPool 在后台线程写盘，生成下一张电路图时不等待磁盘；
+    # 退出 with 时（包括生成中途出错）等待队列写完并 fsync
+    with WriterPool(backend, threads=4) as output, (spice_deck or contextlib.nullcontext()):
+        for i in range(generator_num):
+            selector = registry.selector()
+            print(f"Start generating {i}.kicad_sch!")
+            ComponentNumber = random.randint(10,100)
+            dia = LoopGenerator(selector).gen(ComponentNumber)
+            KicadWriter(i, fast=True, output=output).write(dia)
+            if spice_deck is not None:
+                spice_deck.add(dia, "{}.kicad_sch".format(i))
+            print(f"{i}.kicad_sch generated sucessfully!")
 
+    print("lib_symbols cache: {} hits, {} misses".format(
+        lib_symbol_cache.hits, lib_symbol_cache.misses
+    ))
@@ -2,8 +2,11 @@
 code extracted from: http://rosettacode.org/wiki/S-Expressions
 """
 
+import io
+import itertools
 import re
-from typing import Any, Optional
+import sys
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
 
 dbg: bool = False
 
@@ -17,46 +20,209 @@ term_regex = r"""(?mx)
        )"""
 
 
+term_pattern = re.compile(term_regex)
+bracket_bytes = re.compile(rb"[()]")
+non_brackets = bytes(c for c in range(256) if c not in b"()")
+quoted_bytes = re.compile(rb'"(?:[^"]|(?<=\\)")*"')
+unescaped_quote = re.compile(r'(?<!\\)"')
+# atom text that is not exactly one token
+plain_atom = re.compile(r'[\s()"^]')
+
+
 class SexprError(ValueError):
     pass
 
 
-def parse_sexp(sexp: str) -> Any:
+class SexprNode(list):
+    """a parsed list that also indexes its child lists by their head keyword
+
+    The index is filled while parsing, so lookups don't have to scan the
+    children. It is not updated by list operations, don't mutate parsed nodes.
+    """
+
+    __slots__ = ("children",)
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.children: Dict[str, List["SexprNode"]] = {}
+
+    def add(self, child: Any) -> None:
+        self.append(child)
+        if child and isinstance(child[0], str):
+            self.children.setdefault(child[0], []).append(child)
+
+
+def tokenize(sexp: str) -> Iterator[Tuple[str, str]]:
+    """yield (term, value) pairs, term being the name of the matched group
+
+    The group is taken from the match itself (lastgroup), so no dict of all
+    groups is built per token.
+    """
+    for termtypes in term_pattern.finditer(sexp):
+        term = termtypes.lastgroup
+        yield term, termtypes.group(term)
+
+
+def parse_sexp(sexp: str, node: bool = False) -> Any:
+    """parse sexp into nested lists, or SexprNodes if node is set"""
+    new = SexprNode if node else list
     stack = []
-    out = []
+    out = new()
     if dbg:
         print("%-6s %-14s %-44s %-s" % tuple("term value out stack".split()))
-    for termtypes in re.finditer(term_regex, sexp):
-        term, value = [(t, v) for t, v in termtypes.groupdict().items() if v][0]
+    for term, value in tokenize(sexp):
         if dbg:
             print("%-7s %-14s %-44r %-r" % (term, value, out, stack))
 
         if term == "brackl":
             stack.append(out)
-            out = []
+            out = new()
         elif term == "brackr":
             if not stack:
                 raise SexprError("Trouble with nesting of brackets")
             tmpout, out = out, stack.pop(-1)
-            out.append(tmpout)
-        elif term == "num":
-            v = float(value)
-            if v.is_integer():
-                v = int(v)
-            out.append(v)
-        elif term == "sq":
-            out.append(value[1:-1].replace(r"\"", '"'))
-        elif term == "s":
-            out.append(value)
+            if node:
+                out.add(tmpout)
+            else:
+                out.append(tmpout)
         else:
-            raise NotImplementedError(
-                "The term '{}' with value '{}' is unknown.".format(term, value)
-            )
+            out.append(atom_value(term, value))
     if stack:
         raise SexprError("Trouble with nesting of brackets")
     return out[0]
 
 
+def atom_value(term: str, value: str) -> Any:
+    """convert the text of a non-bracket token into its python value"""
+    if term == "num":
+        v = float(value)
+        if v.is_integer():
+            v = int(v)
+        return v
+    elif term == "sq":
+        return value[1:-1].replace(r"\"", '"')
+    elif term == "s":
+        # keywords repeat all over a file, share one string object for each
+        return sys.intern(value)
+    else:
+        raise NotImplementedError(
+            "The term '{}' with value '{}' is unknown.".format(term, value)
+        )
+
+
+def _tokenize_file(f: TextIO) -> Iterator[Tuple[str, str]]:
+    """tokenize a file object line by line
+
+    Tokens never span a line break except for quoted strings, so lines are
+    only joined while a quoted string is left open.
+    """
+    pending = ""
+    for line in f:
+        pending += line
+        if len(unescaped_quote.findall(pending)) % 2:
+            continue
+        yield from tokenize(pending)
+        pending = ""
+    if pending:
+        yield from tokenize(pending)
+
+
+def iter_events(f: TextIO) -> Iterator[Tuple[str, Any]]:
+    """read a file object and yield ("start", None), ("atom", value) and
+    ("end", None) events without building the tree"""
+    depth = 0
+    for term, value in _tokenize_file(f):
+        if term == "brackl":
+            depth += 1
+            yield "start", None
+        elif term == "brackr":
+            if not depth:
+                raise SexprError("Trouble with nesting of brackets")
+            depth -= 1
+            yield "end", None
+        else:
+            yield "atom", atom_value(term, value)
+    if depth:
+        raise SexprError("Trouble with nesting of brackets")
+
+
+def iter_subtrees(
+    f: TextIO, depth: int = 1, node: bool = False
+) -> Iterator[List[Any]]:
+    """read a file object and yield every list found at the given nesting
+    depth as soon as it is complete (depth 1 being the children of the
+    top-level list). Finished subtrees are not kept, so memory only grows
+    with the largest subtree. The lists are SexprNodes if node is set."""
+    new = SexprNode if node else list
+    stack = []
+    out = new()
+    for term, value in _tokenize_file(f):
+        if term == "brackl":
+            stack.append(out)
+            out = new()
+        elif term == "brackr":
+            if not stack:
+                raise SexprError("Trouble with nesting of brackets")
+            tmpout, out = out, stack.pop(-1)
+            if len(stack) == depth:
+                yield tmpout
+            elif node:
+                out.add(tmpout)
+            else:
+                out.append(tmpout)
+        else:
+            out.append(atom_value(term, value))
+    if stack:
+        raise SexprError("Trouble with nesting of brackets")
+
+
+def index_subtrees(data, head: str = "symbol") -> Dict[str, Tuple[int, int]]:
+    """find the (start, end) byte offsets of every `(head "name" ...)` list
+    directly below the top-level list, in a single scan over bytes or mmap
+
+    Only the quoted strings are visited one by one, the brackets between
+    them are counted in bulk.
+    """
+    header = re.compile(rb"\(\s*" + re.escape(head.encode()) + rb"\s+\Z")
+    index = {}
+    depth = 0
+    pos = 0
+    name = begin = None
+    matches = itertools.chain(quoted_bytes.finditer(data), [None])
+    for m in matches:
+        end = m.start() if m else len(data)
+        gap = data[pos:end]
+        brackets = gap.translate(None, non_brackets)
+        level = depth + brackets.count(b"(") - brackets.count(b")")
+        if begin is not None:
+            # drop the balanced pairs, the leading ")" left over tell how far
+            # the depth falls inside the gap
+            while b"()" in brackets:
+                brackets = brackets.replace(b"()", b"")
+            if depth - (len(brackets) - len(brackets.lstrip(b")"))) <= 1:
+                # the open subtree ends in here, find the exact bracket
+                for bracket in bracket_bytes.finditer(data, pos, end):
+                    depth += 1 if bracket.group() == b"(" else -1
+                    if depth == 1:
+                        index.setdefault(name, (begin, bracket.end()))
+                        begin = None
+                        break
+        depth = level
+        if depth < 0:
+            raise SexprError("Trouble with nesting of brackets")
+        if m is None:
+            break
+        if depth == 2 and begin is None:
+            hdr = header.search(gap)
+            if hdr:
+                begin = pos + hdr.start()
+                name = m.group()[1:-1].decode("utf-8").replace(r"\"", '"')
+        pos = m.end()
+    if depth:
+        raise SexprError("Trouble with nesting of brackets")
+    return index
+
+
 # Form a valid sexpr (single line)
 def SexprItem(val: Any, key: Optional[str] = None) -> str:
     if key:
@@ -193,9 +359,8 @@ def build_sexp(exp, key=None) -> str:
 def format_sexp(sexp: str, indentation_size: int = 2, max_nesting: int = 2) -> str:
     out = ""
     n = 0
-    for termtypes in re.finditer(term_regex, sexp):
+    for term, value in tokenize(sexp):
         indentation = ""
-        term, value = [(t, v) for t, v in termtypes.groupdict().items() if v][0]
         if term == "brackl":
             if out:
                 if n <= max_nesting:
@@ -227,6 +392,164 @@ def format_sexp(sexp: str, indentation_size: int = 2, max_nesting: int = 2) -> s
     return out
 
 
+def atom_text(exp: Any) -> str:
+    """the text build_sexp() writes for a value that is not a list"""
+    if isinstance(exp, float):
+        return str(exp)
+    elif isinstance(exp, int):
+        return str(exp)
+    elif isinstance(exp, str):
+        return exp
+    elif exp == "":
+        return '""'
+    return "%s" % exp
+
+
+def single_token(text: str) -> bool:
+    """
+    True if text reads back as exactly one token whatever surrounds it: a bare
+    word, or a quoted string without inner quotes.
+    """
+    if not plain_atom.search(text):
+        return text != ""
+    return (
+        len(text) > 1
+        and text[0] == text[-1] == '"'
+        and '"' not in text[1:-1]
+        and text[-2] != "\\"
+    )
+
+
+class SexprFormatter:
+    """
+    Write a nested-list tree as indented text in a single walk.
+
+    The output is the same as format_sexp(build_sexp(tree)), without building
+    and re-tokenizing the intermediate string. Trees can be written one after
+    another (e.g. section by section), the indentation state carries over.
+    """
+
+    def __init__(self, f: TextIO, indentation_size: int = 2, max_nesting: int = 2):
+        self.f = f
+        self.indentation_size = indentation_size
+        self.max_nesting = max_nesting
+        self.parts: List[str] = []
+        self.n = 0
+        # the last thing written was an atom, a space follows unless a bracket comes
+        self.pending = False
+        self.last_close = False
+        self.started = False
+        # False once an atom was met whose tokens could depend on the text
+        # around it (an unbalanced quote), see _atom_terms()
+        self.exact = True
+        self._indents = [
+            "\n" + " " * (indentation_size * i) for i in range(max_nesting + 1)
+        ]
+
+    def open(self) -> None:
+        if self.started:
+            if self.n <= self.max_nesting:
+                self.parts.append(self._indents[self.n] if self.n > 0 else "\n")
+            elif self.pending or self.last_close:
+                self.parts.append(" ")
+        self.parts.append("(")
+        self.n += 1
+        self.started = True
+        self.pending = self.last_close = False
+
+    def close(self) -> None:
+        self.parts.append(")")
+        self.n -= 1
+        self.started = self.last_close = True
+        self.pending = False
+
+    def atom(self, value: str) -> None:
+        """write one token (no whitespace, brackets or open quotes inside)"""
+        if self.pending:
+            self.parts.append(" ")
+        self.parts.append(value)
+        self.started = self.pending = True
+        self.last_close = False
+
+    def write_tree(self, exp: Any) -> None:
+        if isinstance(exp, list):
+            self.open()
+            for x in exp:
+                self.write_tree(x)
+            self.close()
+            return
+        text = atom_text(exp)
+        if single_token(text):
+            self.atom(text)
+        elif text:
+            for term, value in self._atom_terms(text):
+                if term == "brackl":
+                    self.open()
+                elif term == "brackr":
+                    self.close()
+                else:
+                    self.atom(value)
+
+    def _atom_terms(self, text: str) -> List[Tuple[str, str]]:
+        # an atom with spaces, brackets or quotes splits into several tokens,
+        # they are the same as in the whole string unless a quote is left open
+        terms = list(tokenize(text + " "))
+        for term, value in terms:
+            if (term == "s" and value[0] == '"') or (
+                term == "sq" and value.endswith('\\"')
+            ):
+                self.exact = False
+        return terms
+
+    def render(self, exp: Any, depth: Optional[int] = None) -> str:
+        """
+        Return the text write_tree(exp) would write at the given depth
+        (default: the current one) after some content, without writing it.
+
+        Lists rendered at a depth up to max_nesting start on a new line, so
+        their text does not depend on what comes before and can be reused with
+        write_text().
+        """
+        saved = (self.parts, self.n, self.pending, self.last_close, self.started)
+        self.parts = []
+        if depth is not None:
+            self.n = depth
+        self.started = True
+        self.pending = self.last_close = False
+        self.write_tree(exp)
+        text = "".join(self.parts)
+        (self.parts, self.n, self.pending, self.last_close, self.started) = saved
+        return text
+
+    def write_text(self, text: str) -> None:
+        """write complete lists rendered at the current depth by render()"""
+        self.parts.append(text)
+        self.started = self.last_close = True
+        self.pending = False
+
+    def flush(self) -> None:
+        self.f.write("".join(self.parts))
+        self.parts = []
+
+    def finish(self) -> None:
+        """end the document like format_sexp() and flush it"""
+        if self.pending:
+            self.parts.append(" ")
+        self.parts.append("\n")
+        self.flush()
+
+
+def format_tree(exp: Any, indentation_size: int = 2, max_nesting: int = 2) -> str:
+    """format_sexp(build_sexp(exp)) in linear time"""
+    out = io.StringIO()
+    formatter = SexprFormatter(out, indentation_size, max_nesting)
+    formatter.write_tree(exp)
+    if not formatter.exact:
+        return format_sexp(build_sexp(exp), indentation_size, max_nesting)
+    formatter.finish()
+    return out.getvalue()
+
+
 if __name__ == "__main__":
     sexp = """ ( ( data "quoted data" 123 4.5)
          (data "with \\"escaped quotes\\"")
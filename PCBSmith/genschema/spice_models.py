@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 元器件的SPICE仿真参数表：从 spice_models.json 读取，按符号名直接查找
+# 每条记录：
+#   names: 使用这条记录的符号名
+#   primitive: Spice_Primitive，缺省为位号的第一个字母
+#   value: Spice_Model 的数值生成规则
+#       {"randint": [a, b], "format": "{value}nF"}  随机整数代入 format
+#       {"format": "1 0 sw_push{index}"}            index 为元器件序号
+#       {"choice": [规则, ...]}                     先按每条规则生成，再随机选一个
+#   model: 固定的 Spice_Model（模型名）
+#   lib: Spice_Lib_File；node_sequence: Spice_Node_Sequence
+
+import json
+import os
+import random
+
+SPICE_MODELS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spice_models.json")
+
+
+class SpiceModel(object):
+
+    def __init__(self, entry: dict):
+        self.names = entry["names"]
+        self.primitive = entry.get("primitive")
+        self.value = entry.get("value")
+        self.model = entry.get("model")
+        self.lib = entry.get("lib")
+        self.node_sequence = entry.get("node_sequence")
+        return
+
+    def get_primitive(self, reference: str):
+        return self.primitive or reference[0]
+
+    def gen_model(self, index: int):
+        # 生成 Spice_Model 的值，没有规则时返回None
+        if self.value is not None:
+            return self.gen_value(self.value, index)
+        return self.model
+
+    def gen_value(self, rule: dict, index: int):
+        if "choice" in rule:
+            options = [self.gen_value(r, index) for r in rule["choice"]]
+            return random.choice(options)
+        value = None
+        if "randint" in rule:
+            value = random.randint(*rule["randint"])
+        return rule["format"].format(value=value, index=index)
+
+
+class SpiceModelRegistry(object):
+
+    def __init__(self, filename: str = SPICE_MODELS_FILE):
+        self.filename = filename
+        # 符号名 -> SpiceModel
+        self.models = {}
+        with open(filename, "r", encoding="utf-8") as f:
+            for entry in json.load(f):
+                model = SpiceModel(entry)
+                for name in model.names:
+                    self.models[name] = model
+        return
+
+    def get(self, name: str):
+        return self.models.get(name)
+
+
+spice_models = SpiceModelRegistry()
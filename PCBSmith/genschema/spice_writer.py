@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 直接从 Diagram 生成 ngspice 网表（.cir），不经过 .kicad_sch 和 eeschema 的网表导出
+#   网络：由 DiagramWire 连接的引脚属于同一网络，接地符号 "0" 所在的网络为 0
+#   元器件：primitive、数值/模型、库文件和引脚顺序与 addSpiceProperty 写入电路图的属性相同
+#   spice.rc：复制到网表旁边（ngspice 启动时读取），例如 ngbehavior=ki；已有的 spice.rc 不会被覆盖
+# 多个电路可以写入同一个网表，每个电路以标题行开始、以 .end 结束
+
+import os
+import shutil
+
+from diagram import Diagram, DiagramSymbol, DiagramPin
+from kicad_writer import SPICE_OPTIONS, get_spice_command, get_spice_params, get_sw_model
+
+SPICE_RC_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "spice.rc")
+GROUND = "0"
+
+
+class SpiceWriter(object):
+
+    def __init__(self, filename: str, rc: str = SPICE_RC_FILE):
+        self.filename = filename
+        # rc: 与网表一起使用的 ngspice 配置文件，None 表示不写
+        self.rc = rc
+        # 创建时就打开网表，路径有误时在生成电路之前报错
+        directory = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(directory, exist_ok=True)
+        self.f = open(filename, "w")
+        self.count = 0
+        return
+
+    def write(self, *dias: Diagram):
+        # 把给出的电路写成一个网表
+        for dia in dias:
+            self.add(dia)
+        self.close()
+        return
+
+    def add(self, dia: Diagram, title=None):
+        # 向网表追加一个电路
+        if self.f is None:
+            raise ValueError("spice deck is closed")
+        if title is None:
+            title = "circuit {}".format(self.count)
+        self.f.write(self.gen(dia, title))
+        self.count += 1
+        return
+
+    def close(self):
+        if self.f is None:
+            return
+        self.f.close()
+        self.f = None
+        if self.rc is not None and os.path.exists(self.rc):
+            target = os.path.join(os.path.dirname(os.path.abspath(self.filename)), "spice.rc")
+            if not os.path.exists(target):
+                shutil.copyfile(self.rc, target)
+            elif not os.path.samefile(self.rc, target):
+                print("spice deck: keeping existing {} (not copying {})".format(target, self.rc))
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return
+
+    def gen(self, dia: Diagram, title: str):
+        nets = self.get_nets(dia)
+        lines = ["* {}".format(title)]
+        elements = []
+        libs = []
+        names = set()
+        for dsym in dia.symbols:
+            reference = dsym.get_prop("Reference")
+            # 接地等电源符号（位号以 # 开头）不是元器件
+            if dsym.name == GROUND or reference.startswith("#"):
+                continue
+            primitive, value, lib, node_sequence = get_spice_params(dsym)
+            if value is None:
+                value = dsym.get_prop("Value")
+            name = reference
+            if not reference.upper().startswith(primitive.upper()):
+                name = primitive + reference
+            # 位号重复时加后缀，ngspice 要求元器件名唯一
+            if name.upper() in names:
+                n = 2
+                while "{}_{}".format(name, n).upper() in names:
+                    n += 1
+                name = "{}_{}".format(name, n)
+            names.add(name.upper())
+            nodes = [nets[id(dpin)] for dpin in self.get_node_pins(dsym, node_sequence)]
+            elements.append(" ".join([name] + nodes + [value]))
+            if lib is not None and lib not in libs:
+                libs.append(lib)
+        for lib in libs:
+            lines.append('.include "{}"'.format(lib))
+        lines.extend(elements)
+        for dsym in dia.symbols:
+            if dsym.name == "SW_Push":
+                lines.append(get_sw_model(dsym))
+        lines.append(SPICE_OPTIONS)
+        lines.append(get_spice_command(dia))
+        lines.append(".end")
+        return "\n".join(lines) + "\n"
+
+    def get_nets(self, dia: Diagram):
+        # 按连线合并引脚，返回 id(引脚) -> 网络名
+        parent = {}
+
+        def find(dpin: DiagramPin):
+            key = id(dpin)
+            root = parent.setdefault(key, key)
+            while root != parent[root]:
+                root = parent[root]
+            while parent[key] != root:
+                parent[key], key = root, parent[key]
+            return root
+
+        for wire in dia.wires:
+            a, b = find(wire.from_), find(wire.to_)
+            if a != b:
+                parent[a] = b
+
+        names = {}
+        for dsym in dia.symbols:
+            if dsym.name == GROUND:
+                for dpin in dsym.pins:
+                    names[find(dpin)] = GROUND
+        nets = {}
+        count = 0
+        for dsym in dia.symbols:
+            for dpin in dsym.pins:
+                root = find(dpin)
+                if root not in names:
+                    count += 1
+                    names[root] = "N{:03d}".format(count)
+                nets[id(dpin)] = names[root]
+        return nets
+
+    def get_node_pins(self, dsym: DiagramSymbol, node_sequence=None):
+        # 节点顺序：有 Spice_Node_Sequence 时按其中的引脚号，否则按引脚号排序
+        pins = {}
+        for dpin in dsym.pins:
+            pins.setdefault(dpin.pin.number, dpin)
+        if node_sequence is not None:
+            return [pins[number.strip()] for number in node_sequence.split(",")]
+        return [pins[number] for number in sorted(pins, key=lambda n: (not n.isdigit(), int(n) if n.isdigit() else 0, n))]
+
+
+if __name__ == '__main__':
+    SpiceWriter("test3.cir").write(Diagram())
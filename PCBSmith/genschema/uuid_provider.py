@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# 电路图中所有 uuid 的来源
+# 随机模式：一次从 os.urandom 取一大块随机字节，逐个切出 uuid4，避免每个 uuid 都读一次系统随机源
+# 确定模式：seed(n) 之后按计数器生成 uuid5，相同的种子生成完全相同的文件
+
+import os
+import threading
+import uuid
+
+
+class UuidProvider(object):
+
+    def __init__(self, block: int = 4096):
+        # 每次取随机字节时生成的 uuid 个数
+        self.block = block
+        self.buffer = b""
+        self.offset = 0
+        # 确定模式的命名空间和计数器，namespace 为 None 表示随机模式
+        self.namespace = None
+        self.counter = 0
+        self.lock = threading.Lock()
+        return
+
+    def seed(self, seed=None):
+        # 设置种子进入确定模式，seed 为 None 时回到随机模式
+        with self.lock:
+            if seed is None:
+                self.namespace = None
+            else:
+                self.namespace = uuid.uuid5(uuid.NAMESPACE_OID, "genschema:{}".format(seed))
+            self.counter = 0
+        return
+
+    def uuid4(self) -> uuid.UUID:
+        with self.lock:
+            if self.namespace is not None:
+                self.counter += 1
+                return uuid.uuid5(self.namespace, str(self.counter))
+            if self.offset >= len(self.buffer):
+                self.buffer = os.urandom(16 * self.block)
+                self.offset = 0
+            data = self.buffer[self.offset:self.offset + 16]
+            self.offset += 16
+        return uuid.UUID(bytes=data, version=4)
+
+
+uuids = UuidProvider()